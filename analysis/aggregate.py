@@ -0,0 +1,167 @@
+# --- Import external libraries ---
+import numpy as np
+from typing import Optional, NamedTuple
+from analysis.trace import CumAckRTT, load_trace
+
+# --- Constants ---
+GRID_POINTS = 500
+PERCENTILES = (5, 25, 50, 75, 95)
+
+class AggregateCurve(NamedTuple):
+    grid:              np.ndarray  # common RTT-normalized time grid
+    curves:            np.ndarray  # (iterations, grid) cumulative bytes ACKed
+    bands:             np.ndarray  # (PERCENTILES, grid) of curves
+    rate_bands:        np.ndarray  # (PERCENTILES, grid - 1) of bytes ACKed per RTT
+    phase_rates:       np.ndarray  # (iterations, phases) bytes per RTT, NaN-padded
+    phase_rate_bands:  np.ndarray  # (PERCENTILES, phases) of phase_rates
+    completion_rtts:   np.ndarray  # (iterations,) RTTs until the last byte ACKed
+
+    @property
+    def median(self) -> np.ndarray:
+        return self.bands[PERCENTILES.index(50)]
+
+# --- Alignment ---
+def align_traces(traces: list[CumAckRTT], grid: np.ndarray) -> np.ndarray:
+    """
+    Resamples the cumulative bytes ACKed of every trace onto @grid with a
+    single np.interp call: the traces are laid end to end on one axis, each
+    shifted by its own offset, and the grid is replicated at those offsets.
+    Before its first sample a trace has ACKed 0 bytes; after its last
+    sample it stays at its total.
+
+    Return:
+        np.ndarray: (len(traces), len(grid)) array.
+    """
+    k = len(traces)
+    starts = np.array([t.rtts[0] for t in traces])
+    ends = np.array([t.rtts[-1] for t in traces])
+    span = float(np.max(ends - starts)) + 1.0
+    offsets = np.arange(k) * span
+
+    xs = np.concatenate([t.rtts - t.rtts[0] + offsets[i] for i, t in enumerate(traces)])
+    ys = np.concatenate([t.cum_acks for t in traces]).astype(np.float64)
+
+    # (k, len(grid)) queries, clamped into each trace's own range
+    queries = np.clip(grid[None, :], starts[:, None], ends[:, None])
+    queries = queries - starts[:, None] + offsets[:, None]
+    curves = np.interp(queries.ravel(), xs, ys).reshape(k, len(grid))
+    curves[grid[None, :] < starts[:, None]] = 0.0
+    return curves
+
+def get_phase_rates(traces: list[CumAckRTT], bkps_list: list[list]) -> np.ndarray:
+    """
+    Returns the ACK rate (bytes per RTT) of every phase of every trace, i.e.
+    the slope between the first and last sample of each segment delimited
+    by the trace's breakpoints, as an (iterations, phases) array padded
+    with NaN.
+    """
+    rates = [[(seg.cum_acks[-1] - seg.cum_acks[0]) / (seg.rtts[-1] - seg.rtts[0])
+              if (len(seg) > 1) and (seg.rtts[-1] > seg.rtts[0]) else np.nan
+              for seg in trace.segments(bkps)]
+             for trace, bkps in zip(traces, bkps_list)]
+    num_phases = max((len(r) for r in rates), default=0)
+    out = np.full((len(rates), num_phases), np.nan)
+    for i, r in enumerate(rates):
+        out[i, :len(r)] = r
+    return out
+
+# --- Aggregation ---
+def aggregate_traces(traces: list[CumAckRTT], bkps_list: Optional[list[list]] = None,
+                     grid_points: int = GRID_POINTS) -> Optional[AggregateCurve]:
+    """
+    Aligns all iterations of one (client, network config) on a common
+    RTT-normalized grid and computes percentile bands of the cumulative
+    bytes ACKed, of the ACK rate, and of the per-phase rates.
+
+    Args:
+        traces (list[CumAckRTT]):  one trace per iteration.
+        bkps_list (list[list]):    breakpoints of each trace (phases are
+                                   skipped if None).
+        grid_points (int):         resolution of the common grid.
+
+    Return:
+        AggregateCurve: aligned curves and their percentile bands, or None if
+                        no trace has at least 2 samples.
+    """
+    keep = [i for i, t in enumerate(traces) if len(t) > 1]
+    if len(keep) == 0:
+        return None
+    traces = [traces[i] for i in keep]
+    if bkps_list is not None:
+        bkps_list = [bkps_list[i] for i in keep]
+
+    end = max(float(t.rtts[-1]) for t in traces)
+    grid = np.linspace(0.0, end, grid_points)
+    curves = align_traces(traces, grid)
+    rates = np.diff(curves, axis=1) / np.diff(grid)[None, :]
+
+    phase_rates = np.empty((len(traces), 0))
+    phase_rate_bands = np.empty((len(PERCENTILES), 0))
+    if bkps_list is not None:
+        phase_rates = get_phase_rates(traces, bkps_list)
+        if phase_rates.shape[1] > 0:
+            with np.errstate(all='ignore'):
+                phase_rate_bands = np.nanpercentile(phase_rates, PERCENTILES, axis=0)
+
+    # First grid point at which each curve reaches its final value
+    totals = curves[:, -1:]
+    completion = grid[np.argmax(curves >= totals, axis=1)]
+
+    return AggregateCurve(
+        grid             = grid,
+        curves           = curves,
+        bands            = np.percentile(curves, PERCENTILES, axis=0),
+        rate_bands       = np.percentile(rates, PERCENTILES, axis=0),
+        phase_rates      = phase_rates,
+        phase_rate_bands = phase_rate_bands,
+        completion_rtts  = completion,
+    )
+
+def group_results(rows: list[dict]) -> dict[tuple[str, str], list[dict]]:
+    """
+    Groups batch analysis rows (see analysis.batch) by (network config,
+    client), keeping the connection with the most bytes ACKed of each trace
+    and only rows with a cached trace. Aborted runs (truncated transfers)
+    are left out.
+    """
+    best: dict[str, dict] = {}
+    for row in rows:
+        if (row.get('trace') is None) or row.get('aborted'):
+            continue
+        if (row['path'] not in best) or (row['bytes_acked'] > best[row['path']]['bytes_acked']):
+            best[row['path']] = row
+
+    groups: dict[tuple[str, str], list[dict]] = {}
+    for row in best.values():
+        groups.setdefault((row['network'], row['client']), []).append(row)
+    return groups
+
+def aggregate_results(rows: list[dict],
+                      grid_points: int = GRID_POINTS) -> dict[tuple[str, str], AggregateCurve]:
+    """
+    Runs aggregate_traces for every (network config, client) in batch
+    analysis rows, using the cached traces and breakpoints.
+    """
+    out = {}
+    for key, group in sorted(group_results(rows).items()):
+        traces = [load_trace(row['trace']) for row in group]
+        bkps_list = [row['bkps'] for row in group]
+        valid = [i for i, t in enumerate(traces) if t is not None]
+        agg = aggregate_traces([traces[i] for i in valid],
+                               [bkps_list[i] for i in valid], grid_points)
+        if agg is not None:
+            out[key] = agg
+    return out
+
+def aggregate_to_dict(agg: AggregateCurve) -> dict:
+    """ JSON-serializable summary of @agg (without the per-iteration curves). """
+    to_list = lambda a: np.where(np.isnan(a), None, a).tolist()
+    return {
+        'iterations':       int(agg.curves.shape[0]),
+        'percentiles':      list(PERCENTILES),
+        'grid':             agg.grid.tolist(),
+        'bands':            agg.bands.tolist(),
+        'rate_bands':       agg.rate_bands.tolist(),
+        'phase_rate_bands': to_list(agg.phase_rate_bands),
+        'completion_rtts':  agg.completion_rtts.tolist(),
+    }
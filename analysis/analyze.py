@@ -1,34 +1,126 @@
 # --- Import external libraries ---
 import json
+import numpy as np
+from array import array
 from typing import Optional, NamedTuple
 from enum import Enum
+from analysis.rtt import RTTNormType, RTTSamples, estimate_rtt, normalize_by_samples
+from analysis.trace import CumAckRTT
+from utils.logging import Logging, log
+from utils.compress import open_text
 
 # --- Constants ---
 ACK_TYPE = '0x0000000000000002'
+# Frames that do not make a packet ack-eliciting (RFC 9002, Section 2):
+# PADDING, ACK, ACK_ECN and CONNECTION_CLOSE
+NON_ACK_ELICITING_TYPES = {'0x0000000000000000', ACK_TYPE, '0x0000000000000003',
+                           '0x000000000000001c', '0x000000000000001d'}
+ACK_DELAY_EXPONENT = 3  # RFC 9000 default ack_delay_exponent
+
+# QUIC packet number spaces (RFC 9000, Section 12.3)
+PN_SPACE_INITIAL   = 0
+PN_SPACE_HANDSHAKE = 1
+PN_SPACE_APP       = 2
 
 class ProtocolType(Enum):
     PROTOCOL_TCP  = 1
     PROTOCOL_QUIC = 2
 
+JSON_CHUNK_SIZE = 1 << 20  # characters read per chunk when streaming traces
+
 # --- Helper Functions ---
+def iter_packets(pcap_file: str):
+    """
+    Yields the packets of a JSON trace (tshark -T json output) one at a time.
+    Compressed traces (.zst, .gz) are decompressed on the fly, and only a
+    chunk of text plus the current packet are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open_text(pcap_file) as f:
+        buf: str = ''
+        pos: int = 0
+        while True:
+            # Skip the opening bracket, separators and whitespace
+            while (pos < len(buf)) and (buf[pos] in '[, \t\r\n'):
+                pos += 1
+            if pos == len(buf):
+                buf, pos = f.read(JSON_CHUNK_SIZE), 0
+                if not buf:
+                    return
+                continue
+            if buf[pos] == ']':
+                return
+
+            try:
+                packet, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:  # packet continues in the next chunk
+                more = f.read(JSON_CHUNK_SIZE)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield packet
+            pos = end
+
 def pcap_file_to_json(pcap_file: str):
+    """
+    Returns the packets of a JSON trace as a list (see iter_packets). The
+    text is streamed, but every decoded packet is kept: the extractors make
+    several passes over the trace.
+    """
     try: 
-        with open(pcap_file) as f:
-            d = json.load(f)
-            return d
+        return list(iter_packets(pcap_file))
     except OSError:
         print(f'[ERROR] could not open file: {pcap_file}, exiting.')
         return None
     
-def normalize_by_RTT(times: list[float], rtt: float) -> list[float]:
-    return list(map(lambda t: t / rtt, times))
-    
-# --- Extract Data --- 
-def get_rtt_static_tcp(pcap_file: str) -> Optional[float]:
-    d = pcap_file_to_json(pcap_file)
-    if not d:
+def normalize_by_RTT(times: np.ndarray, rtt: float) -> np.ndarray:
+    return times / rtt
+
+def detect_protocol(d: list) -> ProtocolType:
+    """ Returns PROTOCOL_QUIC if any packet of the trace carries QUIC. """
+    for packet in d:
+        if 'quic' in packet['_source']['layers']:
+            return ProtocolType.PROTOCOL_QUIC
+    return ProtocolType.PROTOCOL_TCP
+
+def get_quic_field(quic: dict, field: str) -> Optional[str]:
+    """ Returns @field of a QUIC packet, looking into the short header too. """
+    value = quic.get(field)
+    if value is None:
+        quic_short = quic.get('quic.short')
+        if quic_short is not None:
+            value = quic_short.get(field)
+    return value
+
+def get_tcp_option(tcp: dict, option: str) -> Optional[dict]:
+    """ Returns the subtree of TCP option @option (e.g. tcp.options.sack). """
+    options = tcp.get('tcp.options_tree')
+    if options is None:
         return None
+    tree = options.get(f'{option}_tree')
+    if tree is None and (type(options.get(option)) == dict):
+        tree = options.get(option)
+    return tree
+
+def is_ack_eliciting(quic: dict) -> bool:
+    """ True if a QUIC packet has a frame other than ACK, PADDING or CONNECTION_CLOSE. """
+    frames = quic.get('quic.frame') or []
+    if (type(frames) == dict):
+        frames = [frames]
+    return any(f.get('quic.frame_type') not in NON_ACK_ELICITING_TYPES for f in frames)
+
+def get_quic_pn_space(quic: dict) -> int:
+    """ Returns the packet number space of a QUIC packet. """
+    if 'quic.short' in quic:
+        return PN_SPACE_APP
+    match quic.get('quic.long.packet_type'):
+        case '0': return PN_SPACE_INITIAL
+        case '2': return PN_SPACE_HANDSHAKE
+        case _:   return PN_SPACE_APP  # 0-RTT shares the application space
     
+# --- Extract Data --- 
+def get_rtt_static_tcp(d: list) -> Optional[float]:
     # We use TCP-provided initial RTT estimate
     initial_rtt = None
     for packet in d:
@@ -42,11 +134,7 @@ def get_rtt_static_tcp(pcap_file: str) -> Optional[float]:
 
     return initial_rtt
 
-def get_rtt_static_quic(pcap_file: str) -> Optional[float]:
-    d = pcap_file_to_json(pcap_file)
-    if not d:
-        return None
-
+def get_rtt_static_quic(d: list) -> Optional[float]:
     # We sample initial RTT from Client Hello -> Server Hello
     initial_rtt = None
     for packet in d:
@@ -64,61 +152,227 @@ def get_rtt_static_quic(pcap_file: str) -> Optional[float]:
             break 
     return initial_rtt
 
+def get_rtt_samples_quic(d: list) -> RTTSamples:
+    """
+    Per-ACK RTT samples for a QUIC trace. Packets sent by us are matched, per
+    packet number space, to the ACK frames from the server acknowledging
+    them. As in RFC 9002 (Section 5.1), a sample is taken only when the
+    largest acknowledged packet number increases and at least one of the
+    newly acknowledged packets is ack-eliciting (ACK-only packets may be
+    acknowledged arbitrarily late).
+    """
+    # {(packet number space, packet number) : time sent}
+    sent: dict[tuple[int, int], float] = {}
+    # (packet number space, packet number) of our ack-eliciting packets not yet acknowledged
+    eliciting: set[tuple[int, int]] = set()
+    # {packet number space : largest packet number acknowledged so far}
+    largest_acked: dict[int, int] = {}
+
+    times: list[float]       = []
+    latest_rtts: list[float] = []
+    ack_delays: list[float]  = []
+
+    for packet in d:
+        layers = packet['_source']['layers']
+        udp = layers.get('udp')
+        quics = layers.get('quic')
+        if (udp is None) or (quics is None):
+            continue
+
+        time = float(udp['Timestamps']['udp.time_relative']) * 1000  # [ms]
+        is_incoming: bool = (int(udp['udp.srcport']) == 443)
+
+        if (type(quics) == dict):
+            quics = [quics]
+
+        for quic in quics:
+            pn_space: int = get_quic_pn_space(quic)
+            if not is_incoming:  # record send time of our packets
+                pkt_num = get_quic_field(quic, 'quic.packet_number')
+                if pkt_num is not None:
+                    key = (pn_space, int(pkt_num))
+                    sent.setdefault(key, time)
+                    if is_ack_eliciting(quic):
+                        eliciting.add(key)
+                continue
+
+            frames = quic.get('quic.frame')
+            if frames is None:
+                continue
+            if (type(frames) == dict):
+                frames = [frames]
+
+            for frame in frames:
+                if (frame['quic.frame_type'] != ACK_TYPE):
+                    continue
+                ack_target = int(frame['quic.ack.largest_acknowledged'])
+                previous = largest_acked.get(pn_space, -1)
+                if ack_target <= previous:
+                    continue
+                largest_acked[pn_space] = ack_target
+                if (pn_space, ack_target) not in sent:
+                    continue
+
+                # Packets newly acknowledged above the previous largest
+                first = max(previous + 1, ack_target - int(frame.get('quic.ack.first_ack_range', 0)))
+                newly_eliciting = False
+                for pkt_num in range(first, ack_target + 1):
+                    if (pn_space, pkt_num) in eliciting:
+                        eliciting.discard((pn_space, pkt_num))
+                        newly_eliciting = True
+                if not newly_eliciting:
+                    continue
+
+                # ACK delay only applies to the application data space
+                ack_delay = 0.0
+                if pn_space == PN_SPACE_APP:
+                    raw_delay = int(frame.get('quic.ack.ack_delay', 0))
+                    ack_delay = (raw_delay << ACK_DELAY_EXPONENT) / 1000  # [ms]
+
+                times.append(time)
+                latest_rtts.append(time - sent[(pn_space, ack_target)])
+                ack_delays.append(ack_delay)
+
+    return estimate_rtt(np.array(times), np.array(latest_rtts), np.array(ack_delays))
+
+def get_rtt_samples_tcp(d: list) -> RTTSamples:
+    """
+    Per-ACK RTT samples for a TCP trace. Our segments are matched to the
+    server segments echoing their timestamp (RFC 7323): the first segment with
+    TSecr equal to one of our TSvals yields a sample. Without timestamps we
+    fall back to the ACK RTT Wireshark computes for ACKs of our data.
+    """
+    # {TSval : time first sent}
+    sent: dict[int, float] = {}
+    largest_echoed: int = -1
+
+    times: list[float]       = []
+    latest_rtts: list[float] = []
+    ack_rtt_times: list[float] = []
+    ack_rtts: list[float]      = []
+
+    for packet in d:
+        tcp = packet['_source']['layers']['tcp']
+        time = float(tcp['Timestamps']['tcp.time_relative']) * 1000  # [ms]
+        is_incoming: bool = (int(tcp['tcp.srcport']) == 443)
+
+        timestamp = get_tcp_option(tcp, 'tcp.options.timestamp') or {}
+        tsval = timestamp.get('tcp.options.timestamp.tsval')
+        tsecr = timestamp.get('tcp.options.timestamp.tsecr')
+
+        if not is_incoming:
+            if tsval is not None:
+                sent[int(tsval)] = time
+            continue
+
+        if (tsecr is not None) and (int(tsecr) > largest_echoed):
+            largest_echoed = int(tsecr)
+            if largest_echoed in sent:
+                times.append(time)
+                latest_rtts.append(time - sent[largest_echoed])
+
+        tcp_analysis = tcp.get('tcp.analysis') or {}
+        ack_rtt = tcp_analysis.get('tcp.analysis.ack_rtt')
+        if ack_rtt is not None:
+            ack_rtt_times.append(time)
+            ack_rtts.append(float(ack_rtt) * 1000)  # [ms]
+
+    if len(latest_rtts) == 0:
+        times, latest_rtts = ack_rtt_times, ack_rtts
+    return estimate_rtt(np.array(times), np.array(latest_rtts), np.zeros(len(times)))
+
 class CumAckTime(NamedTuple):
-    times: list[float]
-    acks: list[int]
-    cum_acks: list[int]
+    times: np.ndarray  # float64 [ms]
+    acks:  np.ndarray  # int64, bytes ACKed
 
-def get_cumack_tcp(pcap_file: str) -> Optional[CumAckTime]:
-    d = pcap_file_to_json(pcap_file)
-    if not d:
-        return None
-    
-    acks: list[int]     = []
-    cum_acks: list[int] = []
-    times: list[float]  = []
+def get_cumack_tcp(d: list) -> Optional[CumAckTime]:
+    """
+    Bytes newly acknowledged by each of our ACKs. Uses relative sequence
+    numbers: the bytes delivered at each ACK are the cumulative ACK plus the
+    SACKed bytes above it, and the bytes newly ACKed are the clipped
+    np.diff of their running maximum. Pure duplicate ACKs and window updates
+    (same ACK number, no payload, nothing new SACKed) are dropped.
+    """
+    times     = array('d')
+    ack_nums  = array('q')
+    lens      = array('q')
+    # SACK blocks, flattened: (row of the ACK carrying it, left edge, right edge)
+    sack_rows = array('q')
+    sack_les  = array('q')
+    sack_res  = array('q')
+    fin_seq: Optional[int] = None  # sequence number of the server's FIN
 
     for packet in d:
         tcp = packet['_source']['layers']['tcp']
 
         tcp_srcport = int(tcp['tcp.srcport'])
         is_incoming: bool = (tcp_srcport == 443)  # incoming packet from server port 443
-        is_outgoing: bool = not is_incoming
-        is_fin: bool = (tcp['tcp.flags_tree']['tcp.flags.fin'] == '1')
+        flags = tcp['tcp.flags_tree']
 
-        if (is_outgoing and not is_fin):  # we send ACK to server
-            time = float(tcp['Timestamps']['tcp.time_relative']) * 1000  # [ms]
-            ack = int(tcp['tcp.ack'])
-            times.append(time)
-            acks.append(ack)
+        if is_incoming:
+            if (flags['tcp.flags.fin'] == '1') and (fin_seq is None):
+                fin_seq = int(tcp['tcp.seq']) + int(tcp.get('tcp.len', 0))
+            continue
+        if flags.get('tcp.flags.ack') != '1':  # e.g. our SYN
+            continue
+
+        # we send ACK to server
+        row = len(times)
+        times.append(float(tcp['Timestamps']['tcp.time_relative']) * 1000)  # [ms]
+        ack_nums.append(int(tcp['tcp.ack']))
+        lens.append(int(tcp.get('tcp.len', 0)))
+
+        sack = get_tcp_option(tcp, 'tcp.options.sack')
+        if sack is not None:
+            les, res = sack.get('tcp.options.sack_le'), sack.get('tcp.options.sack_re')
+            if (les is not None) and (res is not None):
+                les = les if (type(les) == list) else [les]
+                res = res if (type(res) == list) else [res]
+                for le, re in zip(les, res):
+                    sack_rows.append(row)
+                    sack_les.append(int(le))
+                    sack_res.append(int(re))
+
+    n = len(times)
+    ack_nums = np.frombuffer(ack_nums, dtype=np.int64)
+    if n == 0:
+        return CumAckTime(times=np.empty(0), acks=np.empty(0, dtype=np.int64))
+
+    # Credit SACKed bytes above the cumulative ACK
+    rows = np.frombuffer(sack_rows, dtype=np.int64)
+    les = np.maximum(np.frombuffer(sack_les, dtype=np.int64), ack_nums[rows])
+    sacked = np.clip(np.frombuffer(sack_res, dtype=np.int64) - les, 0, None)
+    delivered = ack_nums + np.bincount(rows, weights=sacked, minlength=n).astype(np.int64)
 
-            if (len(cum_acks) == 0):
-                cum_acks.append(ack)
-            else:
-                cum_acks.append(cum_acks[-1] + ack)
+    # The FIN takes one sequence number but carries no data
+    if fin_seq is not None:
+        delivered = np.minimum(delivered, fin_seq)
+
+    # Relative sequence numbers start at 1 (the SYN)
+    delivered = np.maximum.accumulate(delivered)
+    acks = np.clip(np.diff(delivered, prepend=1), 0, None)
+
+    is_pure_dup = ((acks == 0) & (np.frombuffer(lens, dtype=np.int64) == 0)
+                   & (ack_nums == np.concatenate(([-1], ack_nums[:-1]))))
+    keep = ~is_pure_dup
 
     ret = CumAckTime(
-        times = times, 
-        acks = acks, 
-        cum_acks = cum_acks,
+        times = np.frombuffer(times, dtype=np.float64)[keep], 
+        acks = acks[keep], 
     )
     return ret
 
-def get_cumack_quic(pcap_file: str) -> Optional[CumAckTime]:
-    d = pcap_file_to_json(pcap_file)
-    if not d:
-        return None
-    
-    acks: list[int]     = []
-    cum_acks: list[int] = []
-    times: list[float]  = []
+def get_cumack_quic(d: list) -> Optional[CumAckTime]:
+    acks  = array('q')
+    times = array('d')
 
-    # {packet number : (bytes in flight, latest timestamp)}
-    bif: dict[int, tuple[int, float]] = {}
+    # {(packet number space, packet number) : (bytes in flight, latest timestamp)}
+    bif: dict[tuple[int, int], tuple[int, float]] = {}
 
     for packet in d:
         layers = packet['_source']['layers']
         udp = layers.get('udp')
+        quics = layers.get('quic')
 
         if (udp is None) or (quics is None):
             continue
@@ -127,19 +381,15 @@ def get_cumack_quic(pcap_file: str) -> Optional[CumAckTime]:
         udp_srcport = int(udp['udp.srcport']) 
         is_incoming: bool = (udp_srcport == 443)
 
-        quics = layers.get('quic')
         if (type(quics) == dict): 
             quics = [quics]
 
         # Loop through each QUIC packet
         for quic in quics:
+            pn_space: int = get_quic_pn_space(quic)
             if is_incoming:  # receive data from servers
                 # Get packet number
-                pkt_num : str = quic.get('quic.packet_number')
-                if pkt_num is None:
-                    quic_short = quic.get('quic.short')
-                    if quic_short is not None:
-                        pkt_num = quic_short.get('quic.packet_number')
+                pkt_num : str = get_quic_field(quic, 'quic.packet_number')
                 if pkt_num is None:
                     continue
                 pkt_num : int = int(pkt_num)
@@ -151,10 +401,11 @@ def get_cumack_quic(pcap_file: str) -> Optional[CumAckTime]:
                 pkt_len : int = int(pkt_len)
 
                 # Update bytes-in-flight and timestamp
-                if pkt_num not in bif:
-                    bif[pkt_num] = (0, 0.0)  # default value
-                updated_bif : int = bif[pkt_num][0] + pkt_len
-                bif[pkt_num] = (updated_bif, time)
+                key = (pn_space, pkt_num)
+                if key not in bif:
+                    bif[key] = (0, 0.0)  # default value
+                updated_bif : int = bif[key][0] + pkt_len
+                bif[key] = (updated_bif, time)
 
             else:  # send ACK to server
                 frames = quic.get('quic.frame')
@@ -172,66 +423,80 @@ def get_cumack_quic(pcap_file: str) -> Optional[CumAckTime]:
 
                         # Calculate bytes ACKed by this ACK frame
                         for pkt_num in range(ack_target - ack_range, ack_target + 1):
-                            if pkt_num in bif:  
-                                (bytes_outstanding, _) = bif[pkt_num]
+                            key = (pn_space, pkt_num)
+                            if key in bif:  
+                                (bytes_outstanding, _) = bif[key]
                                 bytes_acked += bytes_outstanding
-                                del bif[pkt_num]
+                                del bif[key]
                             else:
                                 print(f'[ERROR] ACK sent for non-existing packet number {pkt_num}\n')
 
                 times.append(time)
                 acks.append(bytes_acked)
-                if (len(cum_acks) == 0):
-                    cum_acks.append(bytes_acked)
-                else:
-                    cum_acks.append(cum_acks[-1] + bytes_acked)
     
-    ret = ret = CumAckTime(
-        times = times, 
-        acks = acks, 
-        cum_acks = cum_acks,
+    ret = CumAckTime(
+        times = np.frombuffer(times, dtype=np.float64), 
+        acks = np.frombuffer(acks, dtype=np.int64), 
     )
     return ret
 
-class CumAckRTT(NamedTuple):
-    times:    list[float]
-    acks:     list[int]
-    cum_acks: list[int]
-    rtts:     list[float]
-
-def get_cumack_rtt(pcap_file: str, type: ProtocolType) -> Optional[CumAckRTT]:
-    """ 
-    This is the main exported function of this file. Given a PCAP file and 
-    @type specifying whether the PCAP file holds TCP or QUIC traffic, this 
-    function processes data and returns 4 lists: times (in ms), bytes ACKed, 
-    cumulative bytes ACKed, and RTT-normalized times.
+def cumack_rtt_from_packets(d: list, type: ProtocolType,
+                            norm: RTTNormType = RTTNormType.STATIC) -> Optional[CumAckRTT]:
     """
+    Same as get_cumack_rtt, for a trace that has already been parsed.
+    """
+    if not d:
+        return None
 
-    rtt: Optional[float] = None
-    match type:
-        case ProtocolType.PROTOCOL_TCP:  rtt = get_rtt_static_tcp(pcap_file)
-        case ProtocolType.PROTOCOL_QUIC: rtt = get_rtt_static_quic(pcap_file)
-    if (rtt is None):
-        return None 
-    
     cum_ack_times: Optional[CumAckTime] = None
     match type:
-        case ProtocolType.PROTOCOL_TCP:  cum_ack_times = get_cumack_tcp(pcap_file)
-        case ProtocolType.PROTOCOL_QUIC: cum_ack_times = get_cumack_quic(pcap_file)
+        case ProtocolType.PROTOCOL_TCP:  cum_ack_times = get_cumack_tcp(d)
+        case ProtocolType.PROTOCOL_QUIC: cum_ack_times = get_cumack_quic(d)
     if (cum_ack_times is None):
         return None 
     
-    times: list[float]  = cum_ack_times.times
-    acks: list[int]     = cum_ack_times.acks 
-    cum_acks: list[int] = cum_ack_times.cum_acks 
+    times: np.ndarray = cum_ack_times.times
+    acks: np.ndarray  = cum_ack_times.acks 
     assert(len(times) == len(acks))
-    assert(len(times) == len(cum_acks))
-    
-    rtts: list[float] = normalize_by_RTT(times, rtt)
+
+    rtts: Optional[np.ndarray] = None
+    if norm != RTTNormType.STATIC:
+        samples: Optional[RTTSamples] = None
+        match type:
+            case ProtocolType.PROTOCOL_TCP:  samples = get_rtt_samples_tcp(d)
+            case ProtocolType.PROTOCOL_QUIC: samples = get_rtt_samples_quic(d)
+        if len(samples.times) > 0:
+            rtts = normalize_by_samples(times, samples, norm)
+        else:
+            log(Logging.WARN, f'no RTT samples in trace, falling back to static RTT')
+
+    if rtts is None:
+        rtt: Optional[float] = None
+        match type:
+            case ProtocolType.PROTOCOL_TCP:  rtt = get_rtt_static_tcp(d)
+            case ProtocolType.PROTOCOL_QUIC: rtt = get_rtt_static_quic(d)
+        if (rtt is None):
+            return None 
+        rtts = normalize_by_RTT(times, rtt)
+
     ret = CumAckRTT(
         times = times, 
         acks = acks, 
-        cum_acks = cum_acks, 
         rtts = rtts,
     )
     return ret
+
+def get_cumack_rtt(pcap_file: str, type: ProtocolType,
+                   norm: RTTNormType = RTTNormType.STATIC) -> Optional[CumAckRTT]:
+    """ 
+    This is the main exported function of this file. Given a PCAP file and 
+    @type specifying whether the PCAP file holds TCP or QUIC traffic, this 
+    function processes data and returns a CumAckRTT trace holding 4 arrays: 
+    times (in ms), bytes ACKed, cumulative bytes ACKed, and RTT-normalized 
+    times.
+
+    @norm selects the RTT times are normalized by: the static handshake RTT
+    sample, or the per-ACK min_rtt / smoothed_rtt series (see analysis.rtt).
+    """
+    d = pcap_file_to_json(pcap_file)
+    return cumack_rtt_from_packets(d, type, norm)
@@ -0,0 +1,197 @@
+# --- Import external libraries ---
+import json
+import numpy as np
+from typing import Optional
+from analysis.trace import CumAckRTT, load_trace
+from analysis.aggregate import group_results, get_phase_rates
+from analysis.metrics import completion_time
+from analysis.stats import mann_whitney_u, mann_whitney_min_p, holm_adjust
+
+# --- Constants ---
+BASELINE_VERSION = 1
+ALPHA            = 0.05  # significance level of every test
+MIN_EFFECT       = 0.3   # minimum |rank-biserial correlation| to flag a change
+MAX_SLOWDOWN     = 0.05  # tolerated increase of median completion time
+MAX_RATE_DROP    = 0.10  # tolerated decrease of median per-phase rate
+
+# --- Helper Functions ---
+def group_key(network: str, client: str) -> str:
+    return f'{network}/{client}'
+
+def nan_to_none(a) -> list:
+    return [None if (v is None or np.isnan(v)) else float(v) for v in a]
+
+def none_to_nan(a) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in a], dtype=np.float64)
+
+def mode(values: list[int]) -> Optional[int]:
+    if len(values) == 0:
+        return None
+    uniq, counts = np.unique(values, return_counts=True)
+    return int(uniq[np.argmax(counts)])
+
+def collect_group_stats(rows: list[dict]) -> dict[str, dict]:
+    """
+    Summarizes batch analysis rows (see analysis.batch, run with a cache
+    directory) per (network config, client): completion time of every
+    iteration, per-phase rates, and segmentation (breakpoints in RTTs).
+    """
+    stats = {}
+    for (network, client), group in sorted(group_results(rows).items()):
+        traces: list[CumAckRTT] = []
+        bkps_list: list[list] = []
+        for row in group:
+            trace = load_trace(row['trace'])
+            if (trace is not None) and (len(trace) > 1):
+                traces.append(trace)
+                bkps_list.append(row['bkps'])
+        if len(traces) == 0:
+            continue
+
+        phase_rates = get_phase_rates(traces, bkps_list)
+        stats[group_key(network, client)] = {
+            'network':       network,
+            'client':        client,
+            'completion_ms': [completion_time(t) for t in traces],
+            'phase_rates':   [nan_to_none(r) for r in phase_rates],
+            'bkps_rtts':     [[float(t.rtts[b]) for b in bkps if b < len(t)]
+                              for t, bkps in zip(traces, bkps_list)],
+        }
+    return stats
+
+# --- Baseline ---
+def save_baseline(rows: list[dict], out_file: str) -> dict:
+    """ Stores reference statistics of every (network config, client). """
+    baseline = {
+        'version': BASELINE_VERSION,
+        'groups':  collect_group_stats(rows),
+    }
+    with open(out_file, 'w') as f:
+        json.dump(baseline, f, indent=1)
+    return baseline
+
+def load_baseline(in_file: str) -> dict:
+    with open(in_file) as f:
+        baseline = json.load(f)
+    assert(baseline.get('version') == BASELINE_VERSION)
+    return baseline
+
+# --- Gate ---
+def compare_samples(new: np.ndarray, ref: np.ndarray) -> dict:
+    """
+    Mann-Whitney U test of @new against @ref, with the relative change of
+    the median, and the smallest p-value reachable with these sample sizes.
+    """
+    new, ref = new[~np.isnan(new)], ref[~np.isnan(ref)]
+    test = mann_whitney_u(new, ref)
+    min_p = mann_whitney_min_p(len(new), len(ref)) if (len(new) and len(ref)) else 1.0
+    ref_median = float(np.median(ref)) if len(ref) else float('nan')
+    new_median = float(np.median(new)) if len(new) else float('nan')
+    delta = (new_median - ref_median) / ref_median if ref_median else float('nan')
+    (ref_median, new_median, delta, u) = nan_to_none([ref_median, new_median, delta, test.u])
+    return {
+        'baseline_median': ref_median,
+        'median':          new_median,
+        'delta':           delta,
+        'u':               u,
+        'p_value':         test.p_value,
+        'min_p_value':     min_p,
+        'effect_size':     test.effect_size,
+        'n':               int(len(new)),
+        'n_baseline':      int(len(ref)),
+    }
+
+def gate_group(new: dict, ref: dict, alpha: float, min_effect: float,
+               max_slowdown: float, max_rate_drop: float) -> dict:
+    """
+    Tests one (network config, client) against its baseline. It fails if the
+    completion time is significantly slower, if any phase is significantly
+    slower than the baseline (p-values Holm-adjusted across phases), or if
+    there are too few iterations for the completion time test to reach
+    @alpha at all (status 'insufficient_samples'). Phases with too few
+    samples are marked as such and not tested.
+    """
+    completion = compare_samples(np.array(new['completion_ms']), np.array(ref['completion_ms']))
+    completion['insufficient_samples'] = bool(completion['min_p_value'] >= alpha)
+    completion['regressed'] = bool((completion['p_value'] < alpha)
+                                   and (completion['effect_size'] >= min_effect)
+                                   and ((completion['delta'] or 0.0) > max_slowdown))
+
+    new_rates = [none_to_nan(r) for r in new['phase_rates']]
+    ref_rates = [none_to_nan(r) for r in ref['phase_rates']]
+    num_phases = min(max(map(len, new_rates), default=0), max(map(len, ref_rates), default=0))
+
+    phases = []
+    for i in range(num_phases):
+        col = lambda rates: np.array([r[i] if i < len(r) else np.nan for r in rates])
+        phase = compare_samples(col(new_rates), col(ref_rates))
+        phase['phase'] = i
+        phase['insufficient_samples'] = bool(phase['min_p_value'] >= alpha)
+        phases.append(phase)
+
+    # Holm correction over the phases that can be tested
+    tested = [p for p in phases if not p['insufficient_samples']]
+    for phase, p_adjusted in zip(tested, holm_adjust([p['p_value'] for p in tested])):
+        phase['p_adjusted'] = p_adjusted
+    for phase in phases:
+        phase.setdefault('p_adjusted', None)
+        phase['regressed'] = bool((phase['p_adjusted'] is not None)
+                                  and (phase['p_adjusted'] < alpha)
+                                  and (phase['effect_size'] <= -min_effect)
+                                  and ((phase['delta'] or 0.0) < -max_rate_drop))
+
+    segmentation = {
+        'baseline_phases': mode([len(b) + 1 for b in ref['bkps_rtts']]),
+        'phases':          mode([len(b) + 1 for b in new['bkps_rtts']]),
+    }
+    segmentation['changed'] = (segmentation['baseline_phases'] != segmentation['phases'])
+
+    regressed = completion['regressed'] or any(p['regressed'] for p in phases)
+    if completion['insufficient_samples']:
+        status = 'insufficient_samples'
+    else:
+        status = 'fail' if regressed else 'pass'
+    return {
+        'status':       status,
+        'pass':         status == 'pass',
+        'completion':   completion,
+        'phases':       phases,
+        'segmentation': segmentation,
+    }
+
+def gate(rows: list[dict], baseline: dict, alpha: float = ALPHA,
+         min_effect: float = MIN_EFFECT, max_slowdown: float = MAX_SLOWDOWN,
+         max_rate_drop: float = MAX_RATE_DROP) -> dict:
+    """
+    Tests a new run (batch analysis rows) against @baseline for every
+    (network config, client) of the run or of the baseline.
+
+    Return:
+        dict: machine-readable report; 'pass' is False if any group
+              regressed, has too few iterations to be tested (status
+              'insufficient_samples'), or is in the baseline but has no
+              usable trace in the new run (status 'missing', e.g. the
+              client crashed). Groups without a baseline are reported with
+              status 'no_baseline' and do not fail the gate.
+    """
+    groups = {}
+    stats = collect_group_stats(rows)
+    for key, new in stats.items():
+        ref = baseline['groups'].get(key)
+        if ref is None:
+            groups[key] = {'status': 'no_baseline', 'pass': True}
+            continue
+        groups[key] = gate_group(new, ref, alpha, min_effect, max_slowdown, max_rate_drop)
+    for key in sorted(baseline['groups'].keys() - stats.keys()):
+        groups[key] = {'status': 'missing', 'pass': False}
+
+    return {
+        'pass':       all(g['pass'] for g in groups.values()),
+        'thresholds': {
+            'alpha':         alpha,
+            'min_effect':    min_effect,
+            'max_slowdown':  max_slowdown,
+            'max_rate_drop': max_rate_drop,
+        },
+        'groups':     groups,
+    }
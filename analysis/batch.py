@@ -0,0 +1,207 @@
+# --- Import external libraries ---
+import os
+import sys
+import json
+import pathlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+from analysis.analyze import *
+from analysis.demux import split_connections, analyze_connection
+from analysis.trace import save_trace
+from analysis.decimate import DecimateType
+from analysis.loss import LossKind, get_loss_events, align_loss_events, count_per_segment
+from analysis.metrics import COMPLETION_METRICS, get_metrics, parse_bw
+from utils.compress import SUFFIXES, open_stream, resolve_codec, strip_codec_suffix
+
+# --- Constants ---
+P = 1.2  # penalty factor for PELT changepoint detection algorithm
+UNKNOWN_LABEL = 'unknown'
+ABORTED_TAG = '-aborted'  # suffix of runs stopped early (see clients.run_clients)
+SNIFF_BYTES = 4096  # bytes read to tell packet traces from other JSON files
+
+# --- Helper Functions ---
+def is_packet_trace(path: str) -> bool:
+    """ True if @path starts like tshark -T json output (packets with a _source). """
+    try:
+        with open_stream(path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+    except (OSError, EOFError, RuntimeError):
+        return False
+    return head.lstrip().startswith(b'[') and (b'"_source"' in head)
+
+def find_traces(root: str) -> list[str]:
+    """
+    Returns all JSON packet traces under @root (compressed or not), sorted.
+    Trace caches written by analyze_trace (*.trace.json*) and other JSON
+    files (results, baselines, manifests) are skipped.
+    """
+    paths = []
+    for suffix in SUFFIXES.values():
+        paths.extend(pathlib.Path(root).rglob(f'*.json{suffix}'))
+    return sorted(str(p) for p in paths
+                  if ('.trace.json' not in p.name) and is_packet_trace(str(p)))
+
+def trace_stem(path: str) -> str:
+    """ Returns the file name of @path without .json and compression suffix. """
+    return pathlib.Path(strip_codec_suffix(path)).stem
+
+def is_aborted(path: str) -> bool:
+    """
+    True if @path is a run stopped early by online detection: its transfer
+    is truncated, so completion times and goodput do not apply.
+    """
+    return trace_stem(path).endswith(ABORTED_TAG)
+
+def trace_labels(path: str) -> tuple[str, str]:
+    """
+    Returns (client, network config) of a trace written by run_benchmark to
+    pcap/<network config>/<client>/out-<time>.json.
+    """
+    parts = pathlib.Path(path).parts
+    client = parts[-2] if len(parts) >= 2 else UNKNOWN_LABEL
+    network = parts[-3] if len(parts) >= 3 else UNKNOWN_LABEL
+    return (client, network)
+
+# --- Batch Analysis ---
+def analyze_trace(path: str, norm: RTTNormType = RTTNormType.STATIC,
+                  cache_dir: Optional[str] = None, codec: str = 'zstd',
+                  decimation: DecimateType = DecimateType.NONE) -> list[dict]:
+    """
+    Analyzes every connection of one packet trace: extracts the cumulative-ACK
+    trace, finds changepoints with PELT (on a series reduced by @decimation)
+    and, if @cache_dir is given, saves the trace there in the cache format,
+    compressed with @codec.
+
+    Return:
+        list[dict]: one summary row per connection.
+    """
+    from analysis.changepoint import CDAType, get_cp_decimated
+
+    d = pcap_file_to_json(path)
+    if not d:
+        return []
+
+    type: ProtocolType = detect_protocol(d)
+    client, network = trace_labels(path)
+
+    rows = []
+    for conn in split_connections(d, type):
+        result = analyze_connection(conn, type, norm)
+        cumack_rtt: Optional[CumAckRTT] = result.cumack_rtt
+        row = {
+            'path':        path,
+            'client':      client,
+            'network':     network,
+            'protocol':    type.name,
+            'connection':  result.index,
+            'aborted':     is_aborted(path),
+            'flow':        result.flow,
+            'packets':     result.num_packets,
+            'samples':     0,
+            'bytes_acked': 0,
+            'duration_ms': None,
+            'bkps':        [],
+            'loss':        {},
+            'segment_loss': [],
+            'metrics':     None,
+            'trace':       None,
+        }
+
+        if (cumack_rtt is not None) and (len(cumack_rtt) > 1):
+            row['samples']     = len(cumack_rtt)
+            row['bytes_acked'] = int(cumack_rtt.cum_acks[-1])
+            row['duration_ms'] = float(cumack_rtt.times[-1] - cumack_rtt.times[0])
+            bkps = get_cp_decimated(cumack_rtt.rtts, cumack_rtt.cum_acks, CDAType.PELT, P,
+                                    method=decimation)
+            row['bkps'] = [int(b) for b in bkps]
+
+            # Loss events, in total and per segment (gaps + retransmissions)
+            timeline = align_loss_events(get_loss_events(conn.packets, type), cumack_rtt)
+            kinds = timeline.events.kinds
+            row['loss'] = {kind.name.lower(): int(np.sum(kinds == kind.value)) for kind in LossKind}
+            lossy = [LossKind.PN_GAP, LossKind.SEQ_GAP, LossKind.RETRANSMIT]
+            row['segment_loss'] = count_per_segment(timeline, bkps, lossy, len(cumack_rtt)).tolist()
+            row['metrics'] = get_metrics(cumack_rtt, parse_bw(network), conn.packets, type)
+            if row['aborted']:
+                row['metrics'].update(dict.fromkeys(COMPLETION_METRICS))
+
+            if cache_dir is not None:
+                suffix = SUFFIXES[resolve_codec(codec)]
+                trace_file = os.path.join(cache_dir, network, client,
+                                          f'{trace_stem(path)}-conn{result.index}.trace.json{suffix}')
+                os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+                save_trace(cumack_rtt, trace_file)
+                row['trace'] = trace_file
+
+        rows.append(row)
+    return rows
+
+def analyze_dir(root: str, norm: RTTNormType = RTTNormType.STATIC,
+                cache_dir: Optional[str] = None, codec: str = 'zstd',
+                decimation: DecimateType = DecimateType.NONE,
+                max_workers: Optional[int] = None) -> list[dict]:
+    """
+    Runs analyze_trace on every trace under @root on a process pool, printing
+    progress to stderr.
+
+    Return:
+        list[dict]: summary rows of all connections of all traces, sorted by
+                    trace path and connection.
+    """
+    paths = find_traces(root)
+    if len(paths) == 0:
+        log(Logging.WARN, f'no traces found under {root}')
+        return []
+
+    rows: list[dict] = []
+    workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_trace, path, norm, cache_dir, codec, decimation): path
+                   for path in paths}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                log(Logging.WARN, f'failed to analyze {path}: {e!r}')
+            print(f'\r[{done}/{len(paths)}] {path}', end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    rows.sort(key=lambda row: (row['path'], row['connection']))
+    return rows
+
+def write_results(rows: list[dict], out_file: str):
+    with open(out_file, 'w') as f:
+        json.dump(rows, f, indent=1)
+
+def read_results(in_file: str) -> list[dict]:
+    with open(in_file) as f:
+        return json.load(f)
+
+def summarize_results(rows: list[dict]) -> list[dict]:
+    """
+    Aggregates summary rows per (network config, client). Durations of
+    aborted runs are left out.
+    """
+    import numpy as np
+
+    groups: dict[tuple[str, str], list[dict]] = {}
+    for row in rows:
+        groups.setdefault((row['network'], row['client']), []).append(row)
+
+    summary = []
+    for (network, client), group in sorted(groups.items()):
+        durations = np.array([r['duration_ms'] for r in group
+                              if (r['duration_ms'] is not None) and not r.get('aborted')])
+        num_bkps = np.array([len(r['bkps']) for r in group])
+        summary.append({
+            'network':          network,
+            'client':           client,
+            'traces':           len({r['path'] for r in group}),
+            'connections':      len(group),
+            'aborted':          len({r['path'] for r in group if r.get('aborted')}),
+            'bytes_acked':      int(sum(r['bytes_acked'] for r in group)),
+            'median_duration':  float(np.median(durations)) if len(durations) else None,
+            'median_bkps':      float(np.median(num_bkps)) if len(num_bkps) else None,
+        })
+    return summary
@@ -0,0 +1,188 @@
+# --- Import external libraries ---
+import os
+import pickle
+import hashlib
+import inspect
+import functools
+import numpy as np
+from enum import Enum
+from collections import OrderedDict
+from typing import Optional, Callable
+from utils.logging import *
+
+# --- Constants ---
+LRU_ENTRIES    = 1024          # results kept in memory
+DISK_MAX_BYTES = 256 << 20     # size bound of the on-disk tier
+DISK_SUFFIX    = '.pkl'
+
+# --- Keys ---
+def array_digest(a: np.ndarray) -> str:
+    """ Content hash of @a (dtype, shape and bytes). """
+    a = np.ascontiguousarray(a)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'{a.dtype.str}{a.shape}'.encode())
+    h.update(a.tobytes())
+    return h.hexdigest()
+
+def key_part(value) -> str:
+    if isinstance(value, np.ndarray):
+        return array_digest(value)
+    if isinstance(value, Enum):
+        return f'{type(value).__name__}.{value.name}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(key_part(v) for v in value) + ']'
+    return repr(value)
+
+def make_key(name: str, bound: inspect.BoundArguments) -> str:
+    """
+    Cache key of a call: the function name and every argument, defaults
+    included, with arrays replaced by their content hash.
+    """
+    parts = [name] + [f'{k}={key_part(v)}' for k, v in bound.arguments.items()]
+    return hashlib.blake2b('|'.join(parts).encode(), digest_size=20).hexdigest()
+
+# --- Cache ---
+class SegmentationCache:
+    """
+    Two-tier memoization of segmentation results: an in-process LRU of
+    @max_entries results and, if @disk_dir is given, pickled results in
+    that directory, evicted least-recently-used first once they exceed
+    @max_disk_bytes. The disk tier is shared by processes (writes are
+    atomic renames).
+    """
+    def __init__(self, max_entries: int = LRU_ENTRIES, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.lru: OrderedDict[str, object] = OrderedDict()
+        self.disk_bytes: Optional[int] = None  # scanned on first write
+        self.hits, self.misses = 0, 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def clear(self):
+        self.lru.clear()
+        self.hits, self.misses = 0, 0
+
+    # --- Disk tier ---
+    def disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + DISK_SUFFIX)
+
+    def disk_files(self) -> list[os.DirEntry]:
+        return [e for e in os.scandir(self.disk_dir)
+                if e.is_file() and e.name.endswith(DISK_SUFFIX)]
+
+    def disk_get(self, key: str):
+        path = self.disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # most recently used
+            return value
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def disk_put(self, key: str, value):
+        path = self.disk_path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            log(Logging.WARN, f'could not write cache entry {path}: {e!r}')
+            return
+
+        if self.disk_bytes is None:
+            self.disk_bytes = sum(e.stat().st_size for e in self.disk_files())
+        else:
+            self.disk_bytes += size
+        if self.disk_bytes > self.max_disk_bytes:
+            self.evict_disk()
+
+    def evict_disk(self):
+        """ Deletes least recently used entries down to 90% of the bound. """
+        files = sorted(self.disk_files(), key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in files)
+        for entry in files:
+            if total <= 0.9 * self.max_disk_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                pass  # removed by another process
+        self.disk_bytes = total
+
+    # --- Lookup ---
+    def get(self, key: str):
+        """ Cached value of @key, or None. """
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            self.hits += 1
+            return self.lru[key]
+        if self.disk_dir is not None:
+            value = self.disk_get(key)
+            if value is not None:
+                self.hits += 1
+                self.put_lru(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def put_lru(self, key: str, value):
+        self.lru[key] = value
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.max_entries:
+            self.lru.popitem(last=False)
+
+    def put(self, key: str, value):
+        self.put_lru(key, value)
+        if self.disk_dir is not None:
+            self.disk_put(key, value)
+
+# Cache used by memoized functions (see set_cache)
+_cache = SegmentationCache()
+
+def get_cache() -> SegmentationCache:
+    return _cache
+
+def set_cache(max_entries: int = LRU_ENTRIES, disk_dir: Optional[str] = None,
+              max_disk_bytes: int = DISK_MAX_BYTES) -> SegmentationCache:
+    """ Replaces the cache used by memoized functions, e.g. to add a disk tier. """
+    global _cache
+    _cache = SegmentationCache(max_entries, disk_dir, max_disk_bytes)
+    return _cache
+
+def memoized(func: Callable) -> Callable:
+    """
+    Memoizes @func in the current cache, keyed by the content hash of its
+    array arguments and the value of every other argument (defaults
+    included). Results are returned as copies, so callers may modify them.
+    """
+    signature = inspect.signature(func)
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = make_key(name, bound)
+        value = _cache.get(key)
+        if value is None:
+            value = func(*args, **kwargs)
+            _cache.put(key, value)
+        return copy_result(value)
+
+    wrapper.uncached = func
+    return wrapper
+
+def copy_result(value):
+    if isinstance(value, list):
+        return [v.copy() if isinstance(v, np.ndarray) else v for v in value]
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    return value
@@ -1,6 +1,15 @@
 import numpy as np
 import ruptures as rpt
+from typing import Optional
 from utils.logging import *
+from analysis.decimate import DecimateType, Decimated, DECIMATE_TARGET, decimate, map_bkps
+from analysis.cache import memoized
+
+# Default (model, min_size, jump) passed to ruptures by each algorithm
+PELT_PARAMS     = ('l1', 3, 5)
+BINSEG_PARAMS   = ('l2', 2, 5)
+BOTTOMUP_PARAMS = ('l2', 2, 5)
+WINDOW_PARAMS   = ('l2', 2, 5)
 
 class CDAType(Enum):
     PELT     = 1
@@ -34,54 +43,59 @@ def post_process_changepoints(x_vals: np.ndarray, y_vals: np.ndarray,
 
     return post_process_bkps
 
-def get_cp_pelt(x_vals: np.ndarray, y_vals: np.ndarray, p: float) -> list:
+def get_cp_pelt(x_vals: np.ndarray, y_vals: np.ndarray, p: float,
+                model: str = PELT_PARAMS[0], min_size: int = PELT_PARAMS[1],
+                jump: int = PELT_PARAMS[2]) -> list:
     """
     Docs: https://centre-borelli.github.io/ruptures-docs/user-guide/detection/pelt/
     """
     signal = np.column_stack((x_vals, y_vals))
-    model = 'l1'
     n = len(x_vals)
 
-    algo = rpt.Pelt(model=model, min_size=3, jump=5).fit(signal)
+    algo = rpt.Pelt(model=model, min_size=min_size, jump=jump).fit(signal)
     my_bkps = algo.predict(pen=p * np.log(n))
     return my_bkps
 
-def get_cp_binseg(x_vals: np.ndarray, y_vals: np.ndarray, p: float) -> list:
+def get_cp_binseg(x_vals: np.ndarray, y_vals: np.ndarray, p: float,
+                  model: str = BINSEG_PARAMS[0], min_size: int = BINSEG_PARAMS[1],
+                  jump: int = BINSEG_PARAMS[2]) -> list:
     """ 
     Docs: https://centre-borelli.github.io/ruptures-docs/user-guide/detection/binseg/
     """
     signal = np.column_stack((x_vals, y_vals))
-    model = 'l2'
     n = len(x_vals)
     dim = 2
     
-    algo = rpt.Binseg(model=model).fit(signal)
+    algo = rpt.Binseg(model=model, min_size=min_size, jump=jump).fit(signal)
     my_bkps = algo.predict(pen=np.log(n) * dim * p**2)
     return my_bkps
 
-def get_cp_bottomup(x_vals: np.ndarray, y_vals: np.ndarray, p: float) -> list:
+def get_cp_bottomup(x_vals: np.ndarray, y_vals: np.ndarray, p: float,
+                    model: str = BOTTOMUP_PARAMS[0], min_size: int = BOTTOMUP_PARAMS[1],
+                    jump: int = BOTTOMUP_PARAMS[2]) -> list:
     """
     Docs: https://centre-borelli.github.io/ruptures-docs/user-guide/detection/bottomup/
     """
     signal = np.column_stack((x_vals, y_vals))
-    model = 'l2'
     n = len(x_vals)
     dim = 2
     
-    algo = rpt.BottomUp(model=model).fit(signal)
+    algo = rpt.BottomUp(model=model, min_size=min_size, jump=jump).fit(signal)
     my_bkps = algo.predict(pen=np.log(n) * dim * p**2)
     return my_bkps
 
-def get_cp_window(x_vals: np.ndarray, y_vals: np.ndarray, p: float, width: int) -> list:
+def get_cp_window(x_vals: np.ndarray, y_vals: np.ndarray, p: float, width: int,
+                  model: str = WINDOW_PARAMS[0], min_size: int = WINDOW_PARAMS[1],
+                  jump: int = WINDOW_PARAMS[2]) -> list:
     """
     Docs: https://centre-borelli.github.io/ruptures-docs/user-guide/detection/window/
+    @model is one of "l1", "l2", "rbf", "linear", "normal", "ar".
     """
     signal = np.column_stack((x_vals, y_vals))
-    model = "l2"  # "l1", "rbf", "linear", "normal", "ar"
     n = len(x_vals)
     dim = 2
 
-    algo = rpt.Window(width=width, model=model).fit(signal)
+    algo = rpt.Window(width=width, model=model, min_size=min_size, jump=jump).fit(signal)
     my_bkps = algo.predict(pen=np.log(n) * dim * p**2)
     return my_bkps
 
@@ -117,3 +131,69 @@ def get_cp_cusum(x_vals: np.ndarray, y_vals: np.ndarray, threshold: float = 28.0
     
     # bkps = post_process_changepoints(x_vals, y_vals, bkps)
     return bkps
+
+# ruptures parameters of each algorithm, used to resolve get_cp defaults
+CDA_PARAMS = {
+    CDAType.PELT:     PELT_PARAMS,
+    CDAType.BINSEG:   BINSEG_PARAMS,
+    CDAType.BOTTOMUP: BOTTOMUP_PARAMS,
+    CDAType.WINDOW:   WINDOW_PARAMS,
+}
+
+def get_cp(x_vals: np.ndarray, y_vals: np.ndarray, cda_type: CDAType,
+           p: float = 1.0, width: int = 100, model: Optional[str] = None,
+           min_size: Optional[int] = None, jump: Optional[int] = None) -> list:
+    """
+    Runs the changepoint detection algorithm selected by @cda_type.
+    @width is only used by WINDOW; @p is ignored by CUSUM. @model, @min_size
+    and @jump override the ruptures parameters of the algorithm (see
+    *_PARAMS) when given. Results are memoized (see analysis.cache); omitted
+    and unused arguments are resolved first so that equal runs share a key.
+    """
+    if not isinstance(cda_type, CDAType):
+        print('[ERROR]: invalid CDA type provided to get_cp\n')
+        assert(False)  # panic
+    if cda_type == CDAType.CUSUM:
+        return _get_cp(x_vals, y_vals, cda_type, 0.0, 0, None, None, None)
+
+    defaults = CDA_PARAMS[cda_type]
+    model = defaults[0] if model is None else model
+    min_size = defaults[1] if min_size is None else min_size
+    jump = defaults[2] if jump is None else jump
+    width = width if cda_type == CDAType.WINDOW else 0
+    return _get_cp(x_vals, y_vals, cda_type, p, width, model, min_size, jump)
+
+@memoized
+def _get_cp(x_vals: np.ndarray, y_vals: np.ndarray, cda_type: CDAType, p: float,
+            width: int, model: Optional[str], min_size: Optional[int],
+            jump: Optional[int]) -> list:
+    """ Memoized body of get_cp, called with fully resolved arguments. """
+    match cda_type:
+        case CDAType.PELT:     return get_cp_pelt(x_vals, y_vals, p, model, min_size, jump)
+        case CDAType.BINSEG:   return get_cp_binseg(x_vals, y_vals, p, model, min_size, jump)
+        case CDAType.BOTTOMUP: return get_cp_bottomup(x_vals, y_vals, p, model, min_size, jump)
+        case CDAType.WINDOW:   return get_cp_window(x_vals, y_vals, p, width, model, min_size, jump)
+        case CDAType.CUSUM:    return get_cp_cusum(x_vals, y_vals)
+
+def get_cp_decimated(x_vals: np.ndarray, y_vals: np.ndarray, cda_type: CDAType,
+                     p: float = 1.0, width: int = 100,
+                     method: DecimateType = DecimateType.LTTB,
+                     target: int = DECIMATE_TARGET, **params) -> list:
+    """
+    Same as get_cp, but runs the algorithm on a decimated copy of the series
+    (see analysis.decimate) and maps the breakpoints back to exact indices
+    into @x_vals and @y_vals. Series with at most @target points are not
+    decimated. For WINDOW, @width is scaled down with the series. Other
+    keyword arguments (model, min_size, jump) are passed to get_cp.
+    """
+    n = len(x_vals)
+    if (method == DecimateType.NONE) or (n <= target):
+        return get_cp(x_vals, y_vals, cda_type, p, width, **params)
+
+    dec: Decimated = decimate(x_vals, y_vals, method, target=target)
+    m = len(dec.index)
+    scaled_width = max(2, (width * m) // n)
+    log(Logging.DEBUG, f'decimated {n} -> {m} points ({method.name})')
+
+    bkps = get_cp(dec.x, dec.y, cda_type, p, scaled_width, **params)
+    return map_bkps(dec, bkps, x_vals, y_vals)
@@ -0,0 +1,190 @@
+# --- Import external libraries ---
+import numpy as np
+from typing import Optional, NamedTuple
+from enum import Enum
+
+# --- Constants ---
+DECIMATE_TARGET = 2000   # points kept by LTTB, and at most by the other methods
+RTT_BIN_FRAC    = 0.05   # bin width for RTT binning [RTTs]
+COALESCE_GAP    = 0.01   # span of a group of coalesced ACKs [RTTs]
+
+class DecimateType(Enum):
+    NONE     = 0
+    RTT_BINS = 1  # one point per fraction of an RTT
+    LTTB     = 2  # largest-triangle-three-buckets
+    COALESCE = 3  # merge ACKs sent in a short burst (ACK aggregation)
+
+class Decimated(NamedTuple):
+    x:     np.ndarray
+    y:     np.ndarray
+    index: np.ndarray  # index in the original arrays of each point kept
+
+# --- Reduction ---
+def last_of_groups(starts: np.ndarray) -> np.ndarray:
+    """
+    Given a boolean array marking the first element of each group of
+    consecutive samples, returns the indices of the first sample and of the
+    last sample of every group.
+    """
+    n = len(starts)
+    last = np.flatnonzero(np.append(starts[1:], True))
+    return np.unique(np.concatenate(([0], last))) if n > 0 else last
+
+def bounded_width(x: np.ndarray, width: float, max_points: int) -> float:
+    """
+    Returns @width [RTTs], widened if needed so that groups of that width
+    over the span of @x yield at most @max_points points.
+    """
+    if (len(x) < 2) or (max_points < 2):
+        return width
+    return max(width, float(x[-1] - x[0]) / (max_points - 1))
+
+def decimate_rtt_bins(x: np.ndarray, frac: float = RTT_BIN_FRAC,
+                      max_points: int = DECIMATE_TARGET) -> np.ndarray:
+    """
+    Keeps the last sample of every @frac-RTT wide bin of @x. Bins are
+    widened on long traces to keep at most about @max_points samples.
+    """
+    frac = bounded_width(x, frac, max_points)
+    bins = np.floor((x - x[0]) / frac) if len(x) > 0 else x
+    starts = np.append(True, np.diff(bins) != 0)
+    return last_of_groups(starts)
+
+def decimate_coalesce(x: np.ndarray, gap: float = COALESCE_GAP,
+                      max_points: int = DECIMATE_TARGET) -> np.ndarray:
+    """
+    Keeps the last sample of every burst: a group starts at a sample and
+    takes every following sample less than @gap after it. Since the span
+    of a group is bounded, dense ACK trains are thinned rather than merged
+    into one point. @gap is widened on long traces to keep at most about
+    @max_points samples.
+    """
+    n = len(x)
+    if n == 0:
+        return np.arange(0)
+    gap = bounded_width(x, gap, max_points)
+    starts = np.zeros(n, dtype=bool)
+    i = 0
+    while i < n:  # one iteration per group
+        starts[i] = True
+        i = max(int(np.searchsorted(x, x[i] + gap, side='left')), i + 1)
+    return last_of_groups(starts)
+
+def decimate_lttb(x: np.ndarray, y: np.ndarray, target: int = DECIMATE_TARGET) -> np.ndarray:
+    """
+    Largest-triangle-three-buckets: keeps the first and last samples and, in
+    each of @target - 2 buckets, the sample forming the largest triangle with
+    the sample kept in the previous bucket and the mean of the next bucket.
+    """
+    n = len(x)
+    if n <= target or target < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, target - 1).astype(np.int64)
+    index = np.empty(target, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+
+    prev = 0
+    for i in range(target - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_lo, next_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        next_hi = max(next_hi, next_lo + 1)
+        mean_x = x[next_lo:next_hi].mean()
+        mean_y = y[next_lo:next_hi].mean()
+
+        # Twice the triangle area for every candidate in the bucket
+        area = np.abs((x[prev] - mean_x) * (y[lo:hi] - y[prev])
+                      - (x[prev] - x[lo:hi]) * (mean_y - y[prev]))
+        prev = lo + int(np.argmax(area))
+        index[i + 1] = prev
+    return index
+
+def decimate(x: np.ndarray, y: np.ndarray, method: DecimateType,
+             target: int = DECIMATE_TARGET, frac: float = RTT_BIN_FRAC,
+             gap: float = COALESCE_GAP) -> Decimated:
+    """
+    Reduces (@x, @y) to a shorter series that preserves its shape.
+
+    Args:
+        x (np.ndarray):         x-values (RTT-normalized times), sorted.
+        y (np.ndarray):         y-values (cumulative bytes ACKed).
+        method (DecimateType):  reduction to apply.
+        target (int):           number of points kept by LTTB, and about the
+                                most kept by RTT_BINS and COALESCE (whose
+                                bins are widened on long traces).
+        frac (float):           bin width for RTT_BINS [RTTs].
+        gap (float):            span of a coalesced group for COALESCE [RTTs].
+
+    Return:
+        Decimated: reduced series and the original index of each point.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    match method:
+        case DecimateType.RTT_BINS: index = decimate_rtt_bins(x, frac, target)
+        case DecimateType.LTTB:     index = decimate_lttb(x, y, target)
+        case DecimateType.COALESCE: index = decimate_coalesce(x, gap, target)
+        case _:                     index = np.arange(len(x))
+    return Decimated(x=x[index], y=y[index], index=index)
+
+# --- Mapping Breakpoints Back ---
+def best_split(x: np.ndarray, y: np.ndarray, lo: int, hi: int) -> Optional[int]:
+    """
+    Returns the split s in [@lo, @hi) minimizing the total squared error of
+    fitting one line to (@x, @y)[:s] and another to (@x, @y)[s:], or None if
+    no split leaves at least 2 points on each side. Evaluated for all splits
+    at once using prefix sums of the centered data.
+    """
+    n = len(x)
+    lo, hi = max(lo, 2), min(hi, n - 1)
+    if lo >= hi:
+        return None
+
+    xc = x - x.mean()
+    yc = (y - y.mean()).astype(np.float64)
+    prefix = lambda v: np.concatenate(([0.0], np.cumsum(v)))
+    sx, sy = prefix(xc), prefix(yc)
+    sxx, sxy, syy = prefix(xc * xc), prefix(xc * yc), prefix(yc * yc)
+
+    def sse(a, c):
+        # Squared error of the least-squares line through points [a, c)
+        cnt = c - a
+        mx, my = sx[c] - sx[a], sy[c] - sy[a]
+        vxx = (sxx[c] - sxx[a]) - mx * mx / cnt
+        vxy = (sxy[c] - sxy[a]) - mx * my / cnt
+        vyy = (syy[c] - syy[a]) - my * my / cnt
+        with np.errstate(divide='ignore', invalid='ignore'):
+            explained = np.where(vxx > 0, vxy * vxy / vxx, 0.0)
+        return vyy - explained
+
+    splits = np.arange(lo, hi)
+    cost = sse(np.zeros_like(splits), splits) + sse(splits, np.full_like(splits, n))
+    return int(splits[np.argmin(cost)])
+
+def map_bkps(dec: Decimated, bkps: list, x: np.ndarray, y: np.ndarray,
+             refine: bool = True) -> list:
+    """
+    Maps breakpoints found on a decimated series back to indices into the
+    original arrays (@x, @y). A breakpoint b on the reduced series lies
+    between original samples dec.index[b - 1] and dec.index[b]; if @refine,
+    the exact index is chosen in that gap with a two-line fit over the
+    neighbouring reduced points, otherwise dec.index[b] is used. The end of
+    the series (b == len(dec.x)) maps to len(x).
+    """
+    n, m = len(x), len(dec.index)
+    mapped = []
+    for b in bkps:
+        if b >= m:
+            mapped.append(n)
+            continue
+        orig = int(dec.index[b])
+        if refine and b > 0 and (dec.index[b] - dec.index[b - 1] > 1):
+            start = int(dec.index[max(b - 2, 0)])
+            stop = int(dec.index[min(b + 1, m - 1)]) + 1
+            split = best_split(x[start:stop], y[start:stop],
+                               int(dec.index[b - 1]) + 1 - start, orig + 1 - start)
+            if split is not None:
+                orig = start + split
+        mapped.append(orig)
+
+    # Refinement must not reorder or merge breakpoints
+    return sorted(set(mapped))
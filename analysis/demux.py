@@ -0,0 +1,245 @@
+# --- Import external libraries ---
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, NamedTuple
+from analysis.analyze import *
+
+# --- Constants ---
+NEW_CONNECTION_ID_TYPE = '0x0000000000000018'
+
+class Connection(NamedTuple):
+    index:   int   # order of first appearance in the trace
+    flow:    str   # 4-tuple of the first packet, "src:port-dst:port"
+    packets: list  # parsed packets belonging to this connection
+
+class ConnectionResult(NamedTuple):
+    index:       int
+    flow:        str
+    num_packets: int
+    cumack_rtt:  Optional[CumAckRTT]
+
+# --- Helper Functions ---
+def get_ip_addrs(layers: dict) -> Optional[tuple[str, str]]:
+    """ Returns (source, destination) address of a packet, IPv4 or IPv6. """
+    ip = layers.get('ip')
+    if ip is not None:
+        return (ip['ip.src'], ip['ip.dst'])
+    ipv6 = layers.get('ipv6')
+    if ipv6 is not None:
+        return (ipv6['ipv6.src'], ipv6['ipv6.dst'])
+    return None
+
+def get_flow(layers: dict, proto: str) -> Optional[tuple[str, str]]:
+    """
+    Returns the 4-tuple of a packet as a direction-independent pair of
+    "address:port" endpoints, or None if @proto is not present. Addresses
+    are '?' if the trace has no IP layer (e.g. tshark -J without ip).
+    """
+    transport = layers.get(proto)
+    if transport is None:
+        return None
+    addrs = get_ip_addrs(layers) or ('?', '?')
+    src = f'{addrs[0]}:{transport.get(f"{proto}.srcport", "?")}'
+    dst = f'{addrs[1]}:{transport.get(f"{proto}.dstport", "?")}'
+    return (src, dst) if src <= dst else (dst, src)
+
+def format_flow(flow: Optional[tuple[str, str]]) -> str:
+    return '-'.join(flow) if flow is not None else '?'
+
+class UnionFind:
+    """
+    Minimal union-find over hashable identifiers (path halving).
+    """
+    def __init__(self):
+        self.parent: dict = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        root_x, root_y = self.find(x), self.find(y)
+        if root_x != root_y:
+            self.parent[root_y] = root_x
+
+def get_quic_ids(quics) -> list[str]:
+    """
+    Returns the identifiers tying a UDP datagram to its QUIC connection:
+    Wireshark's connection number, source/destination connection IDs, and
+    connection IDs issued in NEW_CONNECTION_ID frames.
+    """
+    if (type(quics) == dict):
+        quics = [quics]
+
+    ids = []
+    for quic in quics:
+        conn_num = quic.get('quic.connection.number')
+        if conn_num is not None:
+            ids.append(f'conn:{conn_num}')
+        for field in ['quic.dcid', 'quic.scid']:
+            cid = get_quic_field(quic, field)
+            if cid:
+                ids.append(f'cid:{cid}')
+
+        frames = quic.get('quic.frame') or []
+        if (type(frames) == dict):
+            frames = [frames]
+        for frame in frames:
+            if frame.get('quic.frame_type') == NEW_CONNECTION_ID_TYPE:
+                cid = frame.get('quic.nci.connection_id')
+                if cid:
+                    ids.append(f'cid:{cid}')
+    return ids
+
+def rebase_quic_times(packets: list) -> list:
+    """
+    udp.time_relative restarts for every UDP 4-tuple, so after a migration it
+    no longer measures time since the connection started. Returns @packets
+    with it rewritten from frame.time_relative, relative to the first packet
+    of the connection (the packets of @packets are left unchanged).
+    """
+    frames = [packet['_source']['layers'].get('frame') for packet in packets]
+    if any((frame is None) or ('frame.time_relative' not in frame) for frame in frames):
+        return packets
+    start = float(frames[0]['frame.time_relative'])
+    rebased = []
+    for packet, frame in zip(packets, frames):
+        layers = packet['_source']['layers']
+        udp = layers['udp']
+        timestamps = dict(udp['Timestamps'])
+        timestamps['udp.time_relative'] = str(float(frame['frame.time_relative']) - start)
+        layers = dict(layers, udp=dict(udp, Timestamps=timestamps))
+        rebased.append(dict(packet, _source=dict(packet['_source'], layers=layers)))
+    return rebased
+
+# --- Demultiplexing ---
+def split_connections_tcp(d: list) -> list[Connection]:
+    """
+    Splits a TCP trace by Wireshark's stream index (tcp.stream), which also
+    tells apart connections reusing a 4-tuple. Without it, splits by
+    4-tuple, and a SYN on a 4-tuple that has already been seen (port reuse)
+    starts a new connection.
+    """
+    # {tcp.stream or 4-tuple : index into groups}
+    current: dict = {}
+    groups: list[tuple[tuple[str, str], list]] = []
+
+    for packet in d:
+        layers = packet['_source']['layers']
+        flow = get_flow(layers, 'tcp')
+        if flow is None:
+            continue
+
+        stream = layers['tcp'].get('tcp.stream')
+        if stream is not None:
+            key = f'stream:{stream}'
+            if key not in current:
+                current[key] = len(groups)
+                groups.append((flow, []))
+            groups[current[key]][1].append(packet)
+            continue
+
+        flags = layers['tcp'].get('tcp.flags_tree', {})
+        is_syn: bool = (flags.get('tcp.flags.syn') == '1') and (flags.get('tcp.flags.ack') != '1')
+        if (flow not in current) or (is_syn and len(groups[current[flow]][1]) > 1):
+            current[flow] = len(groups)
+            groups.append((flow, []))
+        groups[current[flow]][1].append(packet)
+
+    return [Connection(index=i, flow=format_flow(flow), packets=packets)
+            for i, (flow, packets) in enumerate(groups)]
+
+def split_connections_quic(d: list) -> list[Connection]:
+    """
+    Splits a QUIC trace into connections. Datagrams sharing a connection ID
+    (including ones issued by NEW_CONNECTION_ID, so migrations stay in one
+    connection) are grouped together. Datagrams without any decodable
+    connection ID join the connection last seen on the same 4-tuple.
+    """
+    uf = UnionFind()
+    # (packet, representative identifier) in trace order
+    tagged: list[tuple[dict, str]] = []
+    # {4-tuple : identifier of the last connection seen on it}
+    last_on_flow: dict[tuple[str, str], str] = {}
+
+    for packet in d:
+        layers = packet['_source']['layers']
+        quics = layers.get('quic')
+        flow = get_flow(layers, 'udp')
+        if (quics is None) or (flow is None):
+            continue
+
+        ids = get_quic_ids(quics)
+        if len(ids) == 0:
+            ids = [last_on_flow.get(flow, f'flow:{format_flow(flow)}')]
+        for other in ids[1:]:
+            uf.union(ids[0], other)
+        last_on_flow[flow] = ids[0]
+        tagged.append((packet, ids[0]))
+
+    # {connection root : index into groups}
+    roots: dict[str, int] = {}
+    groups: list[tuple[tuple[str, str], list]] = []
+    for packet, ident in tagged:
+        root = uf.find(ident)
+        if root not in roots:
+            roots[root] = len(groups)
+            groups.append((get_flow(packet['_source']['layers'], 'udp'), []))
+        groups[roots[root]][1].append(packet)
+
+    return [Connection(index=i, flow=format_flow(flow), packets=rebase_quic_times(packets))
+            for i, (flow, packets) in enumerate(groups)]
+
+def split_connections(d: list, type: ProtocolType) -> list[Connection]:
+    """
+    Splits a parsed trace into its connections, in order of first appearance.
+    """
+    match type:
+        case ProtocolType.PROTOCOL_TCP:  return split_connections_tcp(d)
+        case ProtocolType.PROTOCOL_QUIC: return split_connections_quic(d)
+
+# --- Per-Connection Analysis ---
+def analyze_connection(conn: Connection, type: ProtocolType,
+                       norm: RTTNormType) -> ConnectionResult:
+    return ConnectionResult(
+        index       = conn.index,
+        flow        = conn.flow,
+        num_packets = len(conn.packets),
+        cumack_rtt  = cumack_rtt_from_packets(conn.packets, type, norm),
+    )
+
+def analyze_connections(pcap_file: str, type: ProtocolType,
+                        norm: RTTNormType = RTTNormType.STATIC,
+                        max_workers: Optional[int] = None) -> list[ConnectionResult]:
+    """
+    Splits @pcap_file into connections and runs get_cumack_rtt on each one
+    independently, in parallel on a process pool.
+
+    Args:
+        pcap_file (str):      JSON packet trace.
+        type (ProtocolType):  whether the trace holds TCP or QUIC traffic.
+        norm (RTTNormType):   RTT normalization, see get_cumack_rtt.
+        max_workers (int):    pool size (defaults to the number of CPUs).
+
+    Return:
+        list[ConnectionResult]: one result per connection, in order of first
+                                appearance; cumack_rtt is None for
+                                connections without usable ACK data.
+    """
+    d = pcap_file_to_json(pcap_file)
+    if not d:
+        return []
+
+    conns: list[Connection] = split_connections(d, type)
+    log(Logging.INFO, f'{pcap_file}: {len(conns)} connection(s)')
+    if len(conns) == 1:  # not worth a pool
+        return [analyze_connection(conns[0], type, norm)]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(conns))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(analyze_connection, conns,
+                                [type] * len(conns), [norm] * len(conns)))
+    return results
@@ -30,13 +30,11 @@ def check_divergence(pcap_file1: str, pcap_file2: str) -> DivergenceResults:
     P = 1.2  # penalty factor for PELT changepoint detection algorithm
     MARGIN = 5.0  # MSE between 2 polys must be greater than this
 
-    rtts1, cum_acks1, times1 = cumack_rtt1.rtts, cumack_rtt1.cum_acks, cumack_rtt1.times
-    rtts1, cum_acks1 = np.ndarray(rtts1), np.ndarray(cum_acks1)
-    brkps1 = get_cp_pelt(rtts1, cum_acks1, P)
+    rtts1, cum_acks1 = cumack_rtt1.rtts, cumack_rtt1.cum_acks
+    brkps1 = get_cp(rtts1, cum_acks1, CDAType.PELT, P)
 
-    rtts2, cum_acks2, times2 = cumack_rtt2.rtts, cumack_rtt2.cum_acks, cumack_rtt2.times
-    rtts2, cum_acks2 = np.ndarray(rtts2), np.ndarray(cum_acks2)
-    brkps2 = get_cp_pelt(rtts2, cum_acks2, P)
+    rtts2, cum_acks2 = cumack_rtt2.rtts, cumack_rtt2.cum_acks
+    brkps2 = get_cp(rtts2, cum_acks2, CDAType.PELT, P)
 
     ret = DivergenceResults(
         is_different = False,
@@ -11,11 +11,13 @@ Docs:
 
 # the higher the better
 def compute_f1_score(precision: float, recall: float) -> float:
+    if (precision + recall) == 0:
+        return 0.0
     return (2 * precision * recall) / (precision + recall)
 
 def grid_search_p(x_vals: np.ndarray, y_vals: np.ndarray, true_bkps: list, 
                   cda_type: CDAType) -> Tuple[float, float]:
-    NUMBER_ITERS = 1e4
+    NUMBER_ITERS = 10000
     max_x = np.max(x_vals)
     max_y = np.max(y_vals)
     max_p = max(max_x, max_y)
@@ -27,9 +29,8 @@ def grid_search_p(x_vals: np.ndarray, y_vals: np.ndarray, true_bkps: list,
         p = i * (max_p / NUMBER_ITERS)
 
         match cda_type:
-            case CDAType.PELT: my_bkps = get_cp_pelt(x_vals, y_vals, p)
-            case CDAType.BINSEG: my_bkps = get_cp_binseg(x_vals, y_vals, p)
-            case CDAType.BOTTOMUP: my_bkps = get_cp_bottomup(x_vals, y_vals, p)
+            case CDAType.PELT | CDAType.BINSEG | CDAType.BOTTOMUP: 
+                my_bkps = get_cp(x_vals, y_vals, cda_type, p)
             case _: 
                 print('[ERROR]: invalid CDA type provided to grid_search_p\n')
                 assert(False)  # panic
@@ -44,9 +45,9 @@ def grid_search_p(x_vals: np.ndarray, y_vals: np.ndarray, true_bkps: list,
     return (best_p, best_f1_score)
 
 def grid_search_p_width(x_vals: np.ndarray, y_vals: np.ndarray, true_bkps: list, 
-                        cda_type: CDAType) -> Tuple[float, float]:
-    NUMBER_ITERS_P = 1e4
-    NUMBER_ITERS_WIDTH = 1e2
+                        cda_type: CDAType) -> Tuple[float, int, float]:
+    NUMBER_ITERS_P = 10000
+    NUMBER_ITERS_WIDTH = 100
 
     max_width = len(x_vals)
     max_x = np.max(x_vals)
@@ -60,10 +61,10 @@ def grid_search_p_width(x_vals: np.ndarray, y_vals: np.ndarray, true_bkps: list,
     for i in range(1, NUMBER_ITERS_P + 1):
         for j in range(1, NUMBER_ITERS_WIDTH + 1):
             p     = i * (max_p / NUMBER_ITERS_P)
-            width = j * (max_width // NUMBER_ITERS_WIDTH)
+            width = max(2, j * (max_width // NUMBER_ITERS_WIDTH))
 
             match cda_type:
-                case CDAType.WINDOW: my_bkps = get_cp_window(x_vals, y_vals, p)
+                case CDAType.WINDOW: my_bkps = get_cp(x_vals, y_vals, cda_type, p, width)
                 case _: 
                     print('[ERROR]: invalid CDA type provided to grid_search_p_width\n')
                     assert(False)  # panic
@@ -0,0 +1,243 @@
+# --- Import external libraries ---
+import numpy as np
+from array import array
+from typing import Optional, NamedTuple
+from enum import Enum
+from analysis.analyze import *
+
+# --- Constants ---
+REORDER_MS = 3.0  # TCP: holes filled faster than this are reordering [ms]
+
+class LossKind(Enum):
+    PN_GAP     = 1  # QUIC packet numbers skipped (packets missing)
+    SEQ_GAP    = 2  # TCP sequence hole (segments missing)
+    REORDER    = 3  # late arrival of a packet/segment sent earlier
+    RETRANSMIT = 4  # retransmitted data filling a hole
+    SPURIOUS   = 5  # retransmitted data that had already been received
+
+class LossEvents(NamedTuple):
+    times:  np.ndarray  # [ms], sorted
+    kinds:  np.ndarray  # LossKind values (int8)
+    amount: np.ndarray  # packets for PN_GAP, bytes otherwise
+
+class LossTimeline(NamedTuple):
+    events: LossEvents
+    idx:    np.ndarray  # index of the first CumAckRTT sample at/after each event
+    rtts:   np.ndarray  # RTT-normalized time of each event
+
+# --- Helper Functions ---
+def shifted_cummax(x: np.ndarray, init: int) -> np.ndarray:
+    """ Running maximum of @x *before* each element (@init for the first). """
+    out = np.empty_like(x)
+    if len(x) > 0:
+        out[0] = init
+        out[1:] = np.maximum.accumulate(x)[:-1]
+        out[1:] = np.maximum(out[1:], init)
+    return out
+
+def is_repeat(*keys: np.ndarray) -> np.ndarray:
+    """ True for every row whose tuple of @keys already occurred earlier. """
+    if len(keys[0]) == 0:
+        return np.zeros(0, dtype=bool)
+    rows = np.column_stack(keys)
+    _, first = np.unique(rows, axis=0, return_index=True)
+    repeat = np.ones(len(rows), dtype=bool)
+    repeat[first] = False
+    return repeat
+
+def make_events(parts: list[tuple[np.ndarray, LossKind, np.ndarray]]) -> LossEvents:
+    """ Merges (times, kind, amount) parts into one time-sorted LossEvents. """
+    times = np.concatenate([t for t, _, _ in parts] + [np.empty(0)])
+    kinds = np.concatenate([np.full(len(t), k.value, dtype=np.int8) for t, k, _ in parts]
+                           + [np.empty(0, dtype=np.int8)])
+    amount = np.concatenate([a for _, _, a in parts] + [np.empty(0, dtype=np.int64)])
+    order = np.argsort(times, kind='stable')
+    return LossEvents(times=times[order], kinds=kinds[order], amount=amount[order])
+
+def is_stream_frame(frame_type: str) -> bool:
+    return (int(frame_type, 16) & ~0x07) == 0x08  # STREAM frames are 0x08-0x0f
+
+def get_stream_frame_length(frame: dict) -> int:
+    length = frame.get('quic.stream.length')
+    if length is None:  # frame extends to the end of the packet
+        data = frame.get('quic.stream_data', '')
+        return (len(data) + 1) // 3 if data else 0
+    return int(length)
+
+# --- QUIC ---
+def get_loss_events_quic(d: list) -> LossEvents:
+    """
+    Loss events of the data we receive over QUIC (1-RTT packets):
+    - PN_GAP: packet numbers skipped at arrival (amount = packets missing),
+    - REORDER: packets arriving with a lower number than one already seen,
+    - RETRANSMIT: STREAM data filling a hole, in a packet that is not late,
+    - SPURIOUS: STREAM data (same stream, offset, length) received twice.
+    """
+    pkt_times = array('d')
+    pkt_nums  = array('q')
+    # STREAM frames: arrival time, packet number, stream id, offset, length
+    f_times, f_pns = array('d'), array('q')
+    f_ids, f_offs, f_lens = array('q'), array('q'), array('q')
+
+    for packet in d:
+        layers = packet['_source']['layers']
+        udp = layers.get('udp')
+        quics = layers.get('quic')
+        if (udp is None) or (quics is None) or (int(udp['udp.srcport']) != 443):
+            continue
+        time = float(udp['Timestamps']['udp.time_relative']) * 1000  # [ms]
+        if (type(quics) == dict):
+            quics = [quics]
+
+        for quic in quics:
+            pkt_num = get_quic_field(quic, 'quic.packet_number')
+            if (pkt_num is None) or (get_quic_pn_space(quic) != PN_SPACE_APP):
+                continue
+            pkt_times.append(time)
+            pkt_nums.append(int(pkt_num))
+
+            frames = quic.get('quic.frame') or []
+            if (type(frames) == dict):
+                frames = [frames]
+            for frame in frames:
+                if not is_stream_frame(frame['quic.frame_type']):
+                    continue
+                f_times.append(time)
+                f_pns.append(int(pkt_num))
+                f_ids.append(int(frame['quic.stream.stream_id']))
+                f_offs.append(int(frame.get('quic.stream.offset', 0)))
+                f_lens.append(get_stream_frame_length(frame))
+
+    times = np.frombuffer(pkt_times, dtype=np.float64)
+    pns = np.frombuffer(pkt_nums, dtype=np.int64)
+    parts = []
+
+    if len(pns) > 0:
+        prev_max = shifted_cummax(pns, pns[0] - 1)
+        gaps = pns - prev_max - 1
+        parts.append((times[gaps > 0], LossKind.PN_GAP, gaps[gaps > 0]))
+        late = pns < prev_max
+        parts.append((times[late], LossKind.REORDER, np.ones(int(late.sum()), dtype=np.int64)))
+
+    f_times = np.frombuffer(f_times, dtype=np.float64)
+    if len(f_times) > 0:
+        f_pns = np.frombuffer(f_pns, dtype=np.int64)
+        f_ids = np.frombuffer(f_ids, dtype=np.int64)
+        f_offs = np.frombuffer(f_offs, dtype=np.int64)
+        f_lens = np.frombuffer(f_lens, dtype=np.int64)
+        f_ends = f_offs + f_lens
+
+        # Highest stream offset received before each frame, per stream:
+        # group frames by stream (stable, so arrival order is kept) and
+        # shift each group into its own range before the running maximum.
+        order = np.argsort(f_ids, kind='stable')
+        ids, ends = f_ids[order], f_ends[order]
+        first = np.concatenate(([True], ids[1:] != ids[:-1]))
+        group = np.cumsum(first) - 1
+        big = int(ends.max()) + 1
+        prev_end = shifted_cummax(ends + group * big, -1) - group * big
+        prev_end[first] = 0
+        prev_end_arrival = np.empty_like(prev_end)
+        prev_end_arrival[order] = prev_end
+
+        # Packet-level lateness, mapped to frames
+        pkt_prev_max = shifted_cummax(f_pns, f_pns[0] - 1)
+        late = f_pns < pkt_prev_max
+
+        spurious = is_repeat(f_ids, f_offs, f_lens)
+        fills = (f_offs < prev_end_arrival) & ~spurious & ~late & (f_lens > 0)
+        parts.append((f_times[spurious], LossKind.SPURIOUS, f_lens[spurious]))
+        parts.append((f_times[fills], LossKind.RETRANSMIT, f_lens[fills]))
+
+    return make_events(parts)
+
+# --- TCP ---
+def get_loss_events_tcp(d: list, reorder_ms: float = REORDER_MS) -> LossEvents:
+    """
+    Loss events of the data we receive over TCP:
+    - SEQ_GAP: segments starting above the highest byte received so far
+      (amount = bytes missing),
+    - REORDER: segments filling a hole within @reorder_ms of its opening,
+    - RETRANSMIT: segments filling a hole later than that,
+    - SPURIOUS: segments (same sequence number and length) received twice.
+    """
+    times, seqs, lens = array('d'), array('q'), array('q')
+    for packet in d:
+        tcp = packet['_source']['layers']['tcp']
+        if int(tcp['tcp.srcport']) != 443:
+            continue
+        length = int(tcp.get('tcp.len', 0))
+        if length == 0:
+            continue
+        times.append(float(tcp['Timestamps']['tcp.time_relative']) * 1000)  # [ms]
+        seqs.append(int(tcp['tcp.seq']))
+        lens.append(length)
+
+    times = np.frombuffer(times, dtype=np.float64)
+    seqs = np.frombuffer(seqs, dtype=np.int64)
+    lens = np.frombuffer(lens, dtype=np.int64)
+    if len(times) == 0:
+        return make_events([])
+
+    ends = seqs + lens
+    prev_end = shifted_cummax(ends, seqs[0])
+    gaps = seqs - prev_end
+
+    spurious = is_repeat(seqs, lens)
+    fills = (seqs < prev_end) & ~spurious
+
+    # A hole at sequence s opened when the highest byte received first
+    # exceeded s; running maxima are sorted, so this is a searchsorted.
+    high = np.maximum.accumulate(ends)
+    opened = np.searchsorted(high, seqs[fills], side='right')
+    waited = times[fills] - times[np.clip(opened, 0, len(times) - 1)]
+    is_reorder = np.zeros(len(times), dtype=bool)
+    is_reorder[np.flatnonzero(fills)[waited < reorder_ms]] = True
+    retransmit = fills & ~is_reorder
+
+    return make_events([
+        (times[gaps > 0],    LossKind.SEQ_GAP,    gaps[gaps > 0]),
+        (times[is_reorder],  LossKind.REORDER,    lens[is_reorder]),
+        (times[retransmit],  LossKind.RETRANSMIT, lens[retransmit]),
+        (times[spurious],    LossKind.SPURIOUS,   lens[spurious]),
+    ])
+
+def get_loss_events(d: list, type: ProtocolType) -> LossEvents:
+    match type:
+        case ProtocolType.PROTOCOL_TCP:  return get_loss_events_tcp(d)
+        case ProtocolType.PROTOCOL_QUIC: return get_loss_events_quic(d)
+
+# --- Alignment with CumAckRTT ---
+def align_loss_events(events: LossEvents, trace: CumAckRTT) -> LossTimeline:
+    """
+    Places loss events on the time axis of @trace: the index of the first
+    ACK sample at or after each event, and the RTT-normalized time of the
+    event (interpolated between ACK samples).
+    """
+    idx = np.searchsorted(trace.times, events.times, side='left')
+    rtts = np.interp(events.times, trace.times, trace.rtts) if len(trace) else np.empty(0)
+    return LossTimeline(events=events, idx=idx, rtts=rtts)
+
+def count_per_segment(timeline: LossTimeline, brkps: list, kinds: list[LossKind],
+                      num_samples: int) -> np.ndarray:
+    """
+    Number of events of @kinds in each segment of the trace delimited by
+    breakpoints @brkps (indices, as returned by the changepoint algorithms).
+    Events after the last ACK sample are counted in the last segment.
+    """
+    bounds = np.array([b for b in brkps if 0 < b < num_samples], dtype=np.int64)
+    mask = np.isin(timeline.events.kinds, [k.value for k in kinds])
+    segment = np.searchsorted(bounds, timeline.idx[mask], side='right')
+    return np.bincount(segment, minlength=len(bounds) + 1)
+
+def get_loss_timeline(pcap_file: str, type: ProtocolType,
+                      norm: RTTNormType = RTTNormType.STATIC) -> Optional[tuple[CumAckRTT, LossTimeline]]:
+    """
+    Returns the cumulative-ACK trace of @pcap_file along with its loss events
+    aligned on it.
+    """
+    d = pcap_file_to_json(pcap_file)
+    trace = cumack_rtt_from_packets(d, type, norm)
+    if trace is None:
+        return None
+    return (trace, align_loss_events(get_loss_events(d, type), trace))
@@ -0,0 +1,234 @@
+# --- Import external libraries ---
+import re
+import csv
+import numpy as np
+from typing import Optional
+from analysis.analyze import ProtocolType
+from analysis.trace import CumAckRTT, load_trace
+from analysis.loss import is_stream_frame
+from analysis.streams import iter_http2_frames
+
+# --- Constants ---
+WINDOW_MS    = 100.0       # window of throughput series and peak goodput [ms]
+STEP_MS      = 10.0        # spacing of throughput series [ms]
+BW_FRACTIONS = (0.5, 0.9)  # reported times to reach these fractions of bw
+HTTP2_DATA_TYPE = '0'
+
+# Columns of the tidy metrics table, after the identity columns
+METRIC_COLUMNS = ['handshake_ms', 'ttfb_ms', 'completion_ms', 'bytes_acked',
+                  'goodput_mbps', 'peak_goodput_mbps'] + \
+                 [f'time_to_{int(f * 100)}pct_bw_ms' for f in BW_FRACTIONS]
+ID_COLUMNS = ['path', 'network', 'client', 'protocol', 'connection', 'aborted']
+# Metrics that assume a complete transfer (None for aborted runs)
+COMPLETION_METRICS = ['completion_ms', 'goodput_mbps']
+
+# --- Trace Metrics ---
+def completion_time(trace: CumAckRTT) -> float:
+    """
+    Time [ms] at which the last byte of @trace is ACKed (trailing ACKs that
+    acknowledge nothing new are ignored), or NaN for an empty trace.
+    """
+    if len(trace) == 0:
+        return float('nan')
+    cum_acks = trace.cum_acks
+    idx = int(np.searchsorted(cum_acks, cum_acks[-1]))
+    return float(trace.times[idx])
+
+def cum_acks_at(trace: CumAckRTT, times: np.ndarray) -> np.ndarray:
+    """ Cumulative bytes ACKed by each of @times [ms] (0 before the first ACK). """
+    idx = np.searchsorted(trace.times, times, side='right') - 1
+    return np.where(idx >= 0, trace.cum_acks[np.clip(idx, 0, None)], 0)
+
+def goodput(trace: CumAckRTT) -> float:
+    """
+    Mean goodput [Mbps] of @trace: bytes ACKed in (0, completion] over
+    completion time. As in throughput_series, bytes ACKed at time 0 fall
+    in no interval, so the mean never exceeds the peak.
+    """
+    t = completion_time(trace)
+    if not (t > 0):
+        return float('nan')
+    acked = float(trace.cum_acks[-1] - cum_acks_at(trace, np.array([0.0]))[0])
+    return acked * 8 / (t * 1000)  # bytes/ms -> Mbps
+
+def throughput_series(trace: CumAckRTT, window_ms: float = WINDOW_MS,
+                      step_ms: float = STEP_MS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Throughput [Mbps] over a sliding window of @window_ms, every @step_ms
+    until completion: bytes ACKed in (t - window, t] from two searchsorted
+    lookups into the cumulative bytes ACKed.
+
+    Return:
+        tuple[np.ndarray, np.ndarray]: window end times [ms] and throughputs.
+    """
+    end = completion_time(trace)
+    if not (end > 0):
+        return (np.empty(0), np.empty(0))
+    times = np.arange(min(window_ms, end), end + step_ms, step_ms)
+    acked = cum_acks_at(trace, times) - cum_acks_at(trace, times - window_ms)
+    return (times, acked * 8 / (window_ms * 1000))  # bytes/ms -> Mbps
+
+def peak_goodput(trace: CumAckRTT, window_ms: float = WINDOW_MS,
+                 series: Optional[tuple[np.ndarray, np.ndarray]] = None) -> float:
+    """
+    Highest throughput [Mbps] over any @window_ms window (on a 1 ms grid,
+    or over @series if given, see throughput_series).
+    """
+    _, mbps = series if series is not None else throughput_series(trace, window_ms, step_ms=1.0)
+    return float(mbps.max()) if len(mbps) else float('nan')
+
+def time_to_bw_fraction(trace: CumAckRTT, bw_mbps: float, frac: float,
+                        window_ms: float = WINDOW_MS,
+                        series: Optional[tuple[np.ndarray, np.ndarray]] = None) -> float:
+    """
+    First time [ms] at which the @window_ms throughput reaches @frac of the
+    link bandwidth @bw_mbps (on a 1 ms grid, or over @series if given), or
+    NaN if it never does.
+    """
+    times, mbps = series if series is not None else throughput_series(trace, window_ms, step_ms=1.0)
+    reached = np.flatnonzero(mbps >= frac * bw_mbps)
+    return float(times[reached[0]]) if len(reached) else float('nan')
+
+# --- Packet Metrics ---
+def handshake_time(d: list, type: ProtocolType) -> float:
+    """
+    Time [ms] at which we finished the handshake of a connection's packets
+    @d: our first 1-RTT (short header) packet for QUIC; for TCP, our first
+    HTTP/2 packet (after TLS), else our ACK of the SYN-ACK.
+    """
+    quic = (type == ProtocolType.PROTOCOL_QUIC)
+    syn_acked = float('nan')
+    for packet in d:
+        layers = packet['_source']['layers']
+        if quic:
+            udp, quics = layers.get('udp'), layers.get('quic')
+            if (udp is None) or (quics is None) or (int(udp['udp.srcport']) == 443):
+                continue
+            quics = quics if isinstance(quics, list) else [quics]
+            if any('quic.short' in q for q in quics):
+                return float(udp['Timestamps']['udp.time_relative']) * 1000
+        else:
+            tcp = layers['tcp']
+            if int(tcp['tcp.srcport']) == 443:
+                continue
+            time = float(tcp['Timestamps']['tcp.time_relative']) * 1000
+            if 'http2' in layers:
+                return time
+            if np.isnan(syn_acked) and tcp['tcp.flags_tree'].get('tcp.flags.syn') != '1':
+                syn_acked = time
+    return syn_acked
+
+def time_to_first_byte(d: list, type: ProtocolType) -> float:
+    """
+    Time [ms] at which the first byte of a response arrived: the first
+    STREAM frame on a request stream for QUIC, the first HTTP/2 DATA frame
+    for TCP (else the first server payload after the handshake).
+    """
+    quic = (type == ProtocolType.PROTOCOL_QUIC)
+    handshake = handshake_time(d, type)
+    for packet in d:
+        layers = packet['_source']['layers']
+        if quic:
+            udp, quics = layers.get('udp'), layers.get('quic')
+            if (udp is None) or (quics is None) or (int(udp['udp.srcport']) != 443):
+                continue
+            for q in (quics if isinstance(quics, list) else [quics]):
+                frames = q.get('quic.frame') or []
+                for frame in (frames if isinstance(frames, list) else [frames]):
+                    if is_stream_frame(frame['quic.frame_type']) and \
+                       (int(frame['quic.stream.stream_id']) % 4 == 0):  # client bidi
+                        return float(udp['Timestamps']['udp.time_relative']) * 1000
+        else:
+            tcp = layers['tcp']
+            if int(tcp['tcp.srcport']) != 443:
+                continue
+            time = float(tcp['Timestamps']['tcp.time_relative']) * 1000
+            http2 = layers.get('http2')
+            if http2 is not None:
+                if any(f.get('http2.type') == HTTP2_DATA_TYPE for f in iter_http2_frames(http2)):
+                    return time
+            elif (int(tcp.get('tcp.len', 0)) > 0) and (time > handshake):
+                return time
+    return float('nan')
+
+# --- All Metrics ---
+def parse_bw(network: str) -> Optional[float]:
+    """ Link bandwidth [Mbps] from a network config name (see network_config_name). """
+    match = re.search(r'(?:^|-)bw-([0-9.]+)', network)
+    return float(match.group(1)) if match else None
+
+def get_metrics(trace: CumAckRTT, bw_mbps: Optional[float] = None,
+                d: Optional[list] = None, type: ProtocolType = ProtocolType.PROTOCOL_TCP,
+                window_ms: float = WINDOW_MS) -> dict[str, Optional[float]]:
+    """
+    Summary metrics of one connection (METRIC_COLUMNS), all times in ms
+    since the start of the connection. Packet metrics (handshake, time to
+    first byte) need the connection's packets @d; times to a fraction of
+    bandwidth need @bw_mbps. Missing metrics are None.
+    """
+    nan = float('nan')
+    series = throughput_series(trace, window_ms, step_ms=1.0)  # shared by peak and bw times
+    metrics = {
+        'handshake_ms':      handshake_time(d, type) if d else nan,
+        'ttfb_ms':           time_to_first_byte(d, type) if d else nan,
+        'completion_ms':     completion_time(trace),
+        'bytes_acked':       float(trace.cum_acks[-1]) if len(trace) else nan,
+        'goodput_mbps':      goodput(trace),
+        'peak_goodput_mbps': peak_goodput(trace, window_ms, series),
+    }
+    for frac in BW_FRACTIONS:
+        metrics[f'time_to_{int(frac * 100)}pct_bw_ms'] = \
+            time_to_bw_fraction(trace, bw_mbps, frac, window_ms, series) if bw_mbps else nan
+    return {k: (None if np.isnan(v) else v) for k, v in metrics.items()}
+
+def fill_metrics(rows: list[dict], window_ms: float = WINDOW_MS) -> list[dict]:
+    """
+    Adds trace metrics to batch analysis rows that lack them (results
+    written before metrics existed), from their cached traces.
+    """
+    for row in rows:
+        if row.get('metrics') or not row.get('trace'):
+            continue
+        trace = load_trace(row['trace'])
+        if (trace is not None) and (len(trace) > 1):
+            row['metrics'] = get_metrics(trace, parse_bw(row['network']), window_ms=window_ms)
+            if row.get('aborted'):
+                row['metrics'].update(dict.fromkeys(COMPLETION_METRICS))
+    return rows
+
+# --- Tidy Tables ---
+def write_metrics_csv(rows: list[dict], out_file: str):
+    """
+    Writes one line per connection of batch analysis rows (see
+    analysis.batch) with its identity and metric columns.
+    """
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=ID_COLUMNS + METRIC_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            metrics = row.get('metrics') or {}
+            writer.writerow({**{c: row.get(c) for c in ID_COLUMNS},
+                             **{c: metrics.get(c) for c in METRIC_COLUMNS}})
+
+def write_throughput_csv(rows: list[dict], out_file: str, window_ms: float = WINDOW_MS,
+                         step_ms: float = STEP_MS) -> int:
+    """
+    Writes the throughput series of every cached trace of batch analysis
+    rows in long format (identity columns, time_ms, mbps).
+
+    Return:
+        int: number of traces written.
+    """
+    written = 0
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ID_COLUMNS + ['time_ms', 'mbps'])
+        for row in rows:
+            trace = load_trace(row['trace']) if row.get('trace') else None
+            if trace is None:
+                continue
+            ident = [row.get(c) for c in ID_COLUMNS]
+            for t, mbps in zip(*throughput_series(trace, window_ms, step_ms)):
+                writer.writerow(ident + [f'{t:.1f}', f'{mbps:.3f}'])
+            written += 1
+    return written
@@ -0,0 +1,273 @@
+# --- Import external libraries ---
+import math
+import subprocess
+from typing import Optional, NamedTuple, Callable, Iterable
+from analysis.analyze import ACK_TYPE, PN_SPACE_INITIAL, PN_SPACE_HANDSHAKE, PN_SPACE_APP
+
+# --- Constants ---
+CUSUM_K        = 0.5   # slack, in standard deviations of the per-bin rate
+CUSUM_H        = 5.0   # detection threshold, in standard deviations
+MIN_PHASE_BINS = 3     # bins used to estimate a new phase before testing it
+STEADY_BINS    = 20    # bins without change after which the phase is steady
+MIN_REL_STD    = 0.05  # floor of the standard deviation, relative to the mean
+
+# tshark -T fields columns read by OnlineAckTracker
+TSHARK_FIELDS_TCP = ['frame.time_relative', 'tcp.srcport', 'tcp.ack', 'tcp.len']
+TSHARK_FIELDS_QUIC = ['frame.time_relative', 'udp.srcport', 'quic.long.packet_type',
+                      'quic.packet_number', 'quic.packet_length', 'quic.frame_type',
+                      'quic.ack.largest_acknowledged', 'quic.ack.first_ack_range']
+
+ACK_FRAME_TYPE = int(ACK_TYPE, 16)
+
+class PhaseChange(NamedTuple):
+    time:       float  # end of the bin in which the change was detected [ms]
+    rtts:       float  # same, in RTTs since the first ACK
+    bin:        int    # index of that bin
+    rate:       float  # bytes ACKed per RTT in that bin
+    phase_rate: float  # mean bytes ACKed per RTT of the phase that ended
+
+def parse_frame_type(value: str) -> int:
+    """ QUIC frame type as printed by tshark, hex ('0x...') or decimal. """
+    return int(value, 16) if value.startswith('0x') else int(value)
+
+# --- Incremental CUSUM ---
+class CUSUMDetector:
+    """
+    Two-sided CUSUM on a stream of samples, O(1) time and memory per
+    sample. The mean and standard deviation of the current phase are
+    estimated (Welford) from its first MIN_PHASE_BINS samples and updated
+    while no change is detected; a change is flagged when either cumulative
+    sum exceeds @h standard deviations, and the detector restarts on the
+    new phase.
+    """
+    __slots__ = ('k', 'h', 'min_samples', 'n', 'mean', 'm2', 'g_pos', 'g_neg')
+
+    def __init__(self, k: float = CUSUM_K, h: float = CUSUM_H,
+                 min_samples: int = MIN_PHASE_BINS):
+        self.k, self.h, self.min_samples = k, h, min_samples
+        self.reset()
+
+    def reset(self):
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        self.g_pos, self.g_neg = 0.0, 0.0
+
+    @property
+    def std(self) -> float:
+        var = self.m2 / (self.n - 1) if self.n > 1 else 0.0
+        return max(math.sqrt(var), MIN_REL_STD * abs(self.mean), 1e-9)
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def update(self, x: float) -> bool:
+        """ Feeds one sample; True if it starts a new phase. """
+        if self.n < self.min_samples:
+            self.add(x)
+            return False
+
+        z = (x - self.mean) / self.std
+        self.g_pos = max(0.0, self.g_pos + z - self.k)
+        self.g_neg = max(0.0, self.g_neg - z - self.k)
+        if (self.g_pos > self.h) or (self.g_neg > self.h):
+            self.reset()
+            self.add(x)
+            return True
+        self.add(x)
+        return False
+
+# --- Online ACK Tracking ---
+class OnlineAckTracker:
+    """
+    Consumes a live tshark fields stream (see tshark_fields_cmd), keeps the
+    bytes newly ACKed by each of our ACKs (same accounting as
+    get_cumack_tcp/get_cumack_quic), sums them into one bin per RTT, and
+    runs a CUSUMDetector on the per-bin rates. The RTT is taken from the
+    handshake (first incoming packet after our first packet). Memory is
+    bounded by the packets in flight.
+    """
+    def __init__(self, is_h3: bool, steady_bins: int = STEADY_BINS,
+                 on_change: Optional[Callable[[PhaseChange], None]] = None,
+                 detector: Optional[CUSUMDetector] = None):
+        self.is_h3 = is_h3
+        self.steady_bins = steady_bins
+        self.on_change = on_change
+        self.detector = detector or CUSUMDetector()
+
+        self.first_out: Optional[float] = None  # time of our first packet [ms]
+        self.rtt: Optional[float] = None        # handshake RTT [ms]
+        self.start: Optional[float] = None      # time of the first ACK [ms]
+        self.bin, self.bin_bytes = 0, 0
+        self.phase_bins, self.phase_bytes = 0, 0
+        self.bytes_acked = 0
+        self.changes: list[PhaseChange] = []
+
+        self.last_ack = 0                          # TCP: highest ACK number
+        self.pending: dict[tuple[int, int], int] = {}  # QUIC: {(space, pn): bytes}
+
+    @property
+    def steady(self) -> bool:
+        """ True once the current phase has lasted @steady_bins RTTs. """
+        return self.phase_bins >= self.steady_bins
+
+    # --- Binning ---
+    def close_bin(self):
+        rate = float(self.bin_bytes)
+        if self.detector.update(rate) and (self.phase_bins > 0):
+            change = PhaseChange(
+                time       = self.start + (self.bin + 1) * self.rtt,
+                rtts       = float(self.bin + 1),
+                bin        = self.bin,
+                rate       = rate,
+                phase_rate = self.phase_bytes / self.phase_bins,
+            )
+            self.changes.append(change)
+            if self.on_change is not None:
+                self.on_change(change)
+            self.phase_bins, self.phase_bytes = 0, 0
+        self.phase_bins += 1
+        self.phase_bytes += self.bin_bytes
+        self.bin += 1
+        self.bin_bytes = 0
+
+    def on_ack(self, time: float, acked: int):
+        """ Accounts @acked bytes newly ACKed at @time [ms]. """
+        if self.rtt is None:
+            return
+        if self.start is None:
+            self.start = time
+        while time >= self.start + (self.bin + 1) * self.rtt:
+            self.close_bin()
+        self.bin_bytes += acked
+        self.bytes_acked += acked
+
+    def on_packet(self, time: float, is_incoming: bool):
+        if is_incoming:
+            if (self.rtt is None) and (self.first_out is not None):
+                self.rtt = max(time - self.first_out, 1e-3)
+        elif self.first_out is None:
+            self.first_out = time
+
+    # --- Parsing ---
+    def feed_line(self, line: str):
+        """ Feeds one line of tshark -T fields output (tab-separated). """
+        fields = line.rstrip('\n').split('\t')
+        try:
+            if self.is_h3:
+                self.feed_quic(fields)
+            else:
+                self.feed_tcp(fields)
+        except (ValueError, IndexError):
+            pass  # malformed or partial line
+
+    def feed_tcp(self, fields: list[str]):
+        time = float(fields[0]) * 1000  # [ms]
+        is_incoming = (int(fields[1]) == 443)
+        self.on_packet(time, is_incoming)
+        if is_incoming or not fields[2]:
+            return
+        ack = int(fields[2])
+        if ack > self.last_ack:
+            acked = (ack - self.last_ack) if self.last_ack > 0 else 0  # skip the SYN
+            self.last_ack = ack
+            self.on_ack(time, acked)
+
+    def feed_quic(self, fields: list[str]):
+        """
+        Accounts one QUIC datagram. Packets we receive cost O(1); each of our
+        ACK frames costs time proportional to its first ACK range, since
+        every packet number it covers is looked up.
+        """
+        split = lambda s: s.split(',') if s else []
+        fields = fields + [''] * (len(TSHARK_FIELDS_QUIC) - len(fields))
+        time = float(fields[0]) * 1000  # [ms]
+        is_incoming = (int(fields[1]) == 443)
+        self.on_packet(time, is_incoming)
+
+        # Long header packets precede the (single) short header packet of
+        # a coalesced datagram.
+        spaces = [{'0': PN_SPACE_INITIAL, '2': PN_SPACE_HANDSHAKE}.get(t, PN_SPACE_APP)
+                  for t in split(fields[2])]
+        if is_incoming:
+            for i, (pn, length) in enumerate(zip(split(fields[3]), split(fields[4]))):
+                space = spaces[i] if i < len(spaces) else PN_SPACE_APP
+                key = (space, int(pn))
+                self.pending[key] = self.pending.get(key, 0) + int(length)
+            return
+
+        # ACK frames cannot be matched to their packet in fields output:
+        # they are attributed to the space of the first packet.
+        space = spaces[0] if spaces else PN_SPACE_APP
+        if not any(parse_frame_type(t) == ACK_FRAME_TYPE for t in split(fields[5])):
+            return
+        acked = 0
+        for ack_target, ack_range in zip(split(fields[6]), split(fields[7])):
+            ack_target, ack_range = int(ack_target), int(ack_range)
+            for pn in range(ack_target - ack_range, ack_target + 1):
+                acked += self.pending.pop((space, pn), 0)
+        self.on_ack(time, acked)
+
+    def feed(self, lines: Iterable[str], should_stop: Optional[Callable[[], bool]] = None):
+        """ Feeds @lines until exhausted or @should_stop returns True. """
+        for line in lines:
+            self.feed_line(line)
+            if (should_stop is not None) and should_stop():
+                break
+
+# --- tshark ---
+def tshark_fields_cmd(is_h3: bool, interface: str, host: Optional[str] = None,
+                      ssl_key_log_file: Optional[str] = None) -> list[str]:
+    """
+    Live capture command printing one line per packet (line-buffered) with
+    the fields OnlineAckTracker reads, for traffic to/from @host (all
+    traffic on @interface if None). QUIC needs the TLS key log, which
+    tshark re-reads as the client writes new secrets.
+    """
+    cmd = ['tshark', '-l', '-i', interface]
+    if host is not None:
+        cmd += ['-f', f'host {host}']
+    cmd += ['-T', 'fields', '-E', 'separator=/t', '-E', 'occurrence=a', '-E', 'aggregator=,']
+    if is_h3:
+        if ssl_key_log_file is not None:
+            cmd += ['-o', f'tls.keylog_file:{ssl_key_log_file}']
+        fields = TSHARK_FIELDS_QUIC
+    else:
+        fields = TSHARK_FIELDS_TCP
+    for field in fields:
+        cmd += ['-e', field]
+    return cmd
+
+def start_capture(cmd: list[str], env=None) -> subprocess.Popen:
+    """
+    Starts @cmd (e.g. tshark_fields_cmd) with its output piped, line-buffered.
+    Its errors (e.g. an invalid capture filter) go to our stderr.
+    """
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, bufsize=1, env=env)
+
+def follow_capture(process: subprocess.Popen, tracker: OnlineAckTracker,
+                   should_stop: Optional[Callable[[], bool]] = None) -> int:
+    """
+    Feeds the output of @process (see start_capture) to @tracker until it
+    exits or @should_stop returns True, then stops it. Meant to run in its
+    own thread; terminating @process from another thread ends it.
+
+    Return:
+        int: exit code of @process if it exited on its own (e.g. tshark
+             failing to start), 0 if it was stopped (here or by a signal).
+    """
+    returncode = None
+    try:
+        tracker.feed(process.stdout, should_stop)
+        if (should_stop is None) or not should_stop():
+            # Output closed: the process is exiting, keep its exit code
+            try:
+                returncode = process.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                pass
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+    return returncode if (returncode is not None) and (returncode > 0) else 0
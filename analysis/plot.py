@@ -0,0 +1,241 @@
+# --- Import external libraries ---
+import os
+import html
+import pathlib
+import matplotlib
+matplotlib.use('Agg')  # no display, safe in worker processes
+import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, NamedTuple
+from analysis.analyze import *
+from analysis.trace import load_trace
+from analysis.decimate import decimate_lttb
+from analysis.polyfit import get_best_polys
+from analysis.changepoint import CDAType, get_cp_decimated
+
+# --- Constants ---
+MAX_LINE_POINTS = 4000    # series longer than this are drawn LTTB-decimated
+RASTER_THRESHOLD = 20000  # scatter layers with more points are rasterized
+FIG_SIZE = (8, 5)
+DPI = 100
+POLY_POINTS = 50          # points per fitted polynomial
+P = 1.2                   # penalty factor for PELT changepoint detection algorithm
+
+class PlotJob(NamedTuple):
+    trace_file: str           # trace in the cache format
+    out_file:   str           # .png or .pdf
+    title:      str
+    bkps:       Optional[list]
+
+# --- Helper Functions ---
+def line_points(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ (@x, @y) reduced with LTTB to at most MAX_LINE_POINTS points. """
+    index = decimate_lttb(x, y, MAX_LINE_POINTS)
+    return (x[index], y[index])
+
+def draw_trace(ax, trace: CumAckRTT, bkps: Optional[list] = None,
+               polys: bool = True, **line_kwargs):
+    """
+    Draws cumulative bytes ACKed vs RTT-normalized time of @trace on @ax, with
+    a rasterized scatter of the raw samples when they are dense, vertical
+    lines at breakpoints @bkps and, if @polys, the best polynomial fitted to
+    each segment.
+    """
+    x, y = trace.rtts, trace.cum_acks
+    lx, ly = line_points(x, y)
+    ax.plot(lx, ly, linewidth=1.0, **line_kwargs)
+    if len(x) > MAX_LINE_POINTS:
+        ax.scatter(x, y, s=0.5, alpha=0.3, color='gray',
+                   rasterized=(len(x) > RASTER_THRESHOLD))
+
+    if bkps is None:
+        return
+    bkps = [b for b in bkps if 0 < b < len(x)]
+    for b in bkps:
+        ax.axvline(x[b], color='red', linestyle='--', linewidth=0.8)
+
+    if polys:
+        bounds = [0] + bkps + [len(x)]
+        for poly, start, stop in zip(get_best_polys(x, y, bkps), bounds[:-1], bounds[1:]):
+            if stop - start < 2:
+                continue
+            xs = np.linspace(x[start], x[stop - 1], POLY_POINTS)
+            ax.plot(xs, np.polyval(poly, xs), color='black', linewidth=0.8, alpha=0.7)
+
+def label_axes(ax, title: str):
+    ax.set_xlabel('time [RTTs]')
+    ax.set_ylabel('cumulative bytes ACKed')
+    ax.set_title(title, fontsize=9)
+    ax.grid(True, linewidth=0.3)
+
+def save_figure(fig, out_file: str):
+    os.makedirs(os.path.dirname(out_file) or '.', exist_ok=True)
+    fig.savefig(out_file, dpi=DPI)
+    plt.close(fig)
+
+# --- Single Trace Plots ---
+def plot_trace(trace: CumAckRTT, out_file: str, title: str = '',
+               bkps: Optional[list] = None, correct_bkps: Optional[list] = None):
+    """
+    Renders one cumulative-ACK vs RTT figure to @out_file (.png or .pdf). If
+    @correct_bkps is given, they are drawn as green lines for comparison.
+    """
+    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    draw_trace(ax, trace, bkps)
+    for b in (correct_bkps or []):
+        if 0 < b < len(trace):
+            ax.axvline(trace.rtts[b], color='green', linewidth=0.8)
+    label_axes(ax, title)
+    save_figure(fig, out_file)
+
+def render_job(job: PlotJob) -> str:
+    trace = load_trace(job.trace_file)
+    if trace is None or len(trace) < 2:
+        return ''
+    plot_trace(trace, job.out_file, job.title, job.bkps)
+    return job.out_file
+
+def read_csv_quic(csv_file: str) -> Optional[CumAckRTT]:
+    """ Reads a QUIC trace in the cache format. """
+    return load_trace(csv_file)
+
+def generate_plot_quic_csv(csv_file: str, correct_bkps: Optional[list] = None,
+                           alg: CDAType = CDAType.PELT, p: float = P,
+                           width: int = 100, out_file: Optional[str] = None) -> Optional[str]:
+    """
+    Plots a cached trace with the breakpoints found by @alg, and
+    @correct_bkps for comparison.
+    """
+    trace = read_csv_quic(csv_file)
+    if trace is None or len(trace) < 2:
+        return None
+    bkps = get_cp_decimated(trace.rtts, trace.cum_acks, alg, p, width)
+    out_file = out_file or str(pathlib.Path(csv_file).with_suffix('.png'))
+    plot_trace(trace, out_file, f'{csv_file} ({alg.name})', bkps, correct_bkps)
+    return out_file
+
+def generate_plot(json_file: str, type: ProtocolType, client: str = '',
+                  out_file: Optional[str] = None) -> Optional[str]:
+    """
+    Plots a JSON packet trace with PELT breakpoints and fitted polynomials.
+    """
+    trace = get_cumack_rtt(json_file, type)
+    if trace is None or len(trace) < 2:
+        return None
+    bkps = get_cp_decimated(trace.rtts, trace.cum_acks, CDAType.PELT, P)
+    out_file = out_file or f'{json_file.split(".json")[0]}.png'
+    plot_trace(trace, out_file, f'{client} {pathlib.Path(json_file).name}', bkps)
+    return out_file
+
+def generate_plot_tcp(json_file: str, client: str = '') -> Optional[str]:
+    return generate_plot(json_file, ProtocolType.PROTOCOL_TCP, client)
+
+def generate_plot_quic(json_file: str, client: str = '') -> Optional[str]:
+    return generate_plot(json_file, ProtocolType.PROTOCOL_QUIC, client)
+
+# --- Overlays ---
+def plot_overlay(traces: list[CumAckRTT], out_file: str, title: str = '',
+                 grid: Optional[np.ndarray] = None, bands: Optional[np.ndarray] = None):
+    """
+    Overlays many traces of one (network config, client) as thin rasterized
+    lines. If aggregate percentile @bands on @grid are given (see
+    analysis.aggregate), draws the outer band and the median on top.
+    """
+    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    for trace in traces:
+        if len(trace) < 2:
+            continue
+        lx, ly = line_points(trace.rtts, trace.cum_acks)
+        ax.plot(lx, ly, color='tab:blue', linewidth=0.4, alpha=0.25, rasterized=True)
+
+    if (grid is not None) and (bands is not None):
+        ax.fill_between(grid, bands[0], bands[-1], color='tab:orange', alpha=0.3,
+                        label='percentile band')
+        ax.plot(grid, bands[len(bands) // 2], color='tab:red', linewidth=1.5, label='median')
+        ax.legend(loc='lower right', fontsize=8)
+
+    label_axes(ax, f'{title} ({len(traces)} traces)')
+    save_figure(fig, out_file)
+
+# --- Batch Rendering ---
+def render_plots(jobs: list[PlotJob], max_workers: Optional[int] = None) -> list[str]:
+    """
+    Renders @jobs on a process pool, each worker using the Agg backend.
+
+    Return:
+        list[str]: files written, in the order of @jobs.
+    """
+    if len(jobs) == 0:
+        return []
+    done: dict[int, str] = {}
+    workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            try:
+                done[futures[future]] = future.result()
+            except Exception as e:
+                log(Logging.WARN, f'failed to plot {jobs[futures[future]].trace_file}: {e!r}')
+    return [done[i] for i in sorted(done) if done[i]]
+
+def write_index(out_dir: str, sections: dict[str, list[str]]) -> str:
+    """
+    Writes out_dir/index.html listing figures by section, with overlays
+    first. Figures are linked relative to @out_dir.
+    """
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">',
+             '<title>quic-automated plots</title>',
+             '<style>img{width:400px;margin:4px}h2{font-family:sans-serif}</style>',
+             '</head><body>']
+    for section, files in sections.items():
+        lines.append(f'<h2>{html.escape(section)}</h2>')
+        for f in files:
+            rel = html.escape(os.path.relpath(f, out_dir))
+            if f.endswith('.pdf'):  # browsers do not render PDFs in <img>
+                lines.append(f'<a href="{rel}">{rel}</a><br>')
+            else:
+                lines.append(f'<a href="{rel}"><img loading="lazy" src="{rel}" title="{rel}"></a>')
+    lines.append('</body></html>')
+
+    index_file = os.path.join(out_dir, 'index.html')
+    with open(index_file, 'w') as f:
+        f.write('\n'.join(lines))
+    return index_file
+
+def plot_results(rows: list[dict], out_dir: str, fmt: str = 'png',
+                 max_workers: Optional[int] = None) -> str:
+    """
+    Renders every cached trace of batch analysis rows (see analysis.batch),
+    one overlay with aggregate bands per (network config, client), and an
+    index page.
+
+    Return:
+        str: path of the index page.
+    """
+    from analysis.aggregate import group_results, aggregate_traces
+
+    jobs = []
+    for row in rows:
+        if row.get('trace') is None:
+            continue
+        stem = pathlib.Path(row['path']).name.split('.json')[0]
+        out_file = os.path.join(out_dir, row['network'], row['client'],
+                                f'{stem}-conn{row["connection"]}.{fmt}')
+        jobs.append(PlotJob(row['trace'], out_file, f'{row["client"]} {stem}', row['bkps']))
+    files = render_plots(jobs, max_workers)
+
+    sections: dict[str, list[str]] = {}
+    for (network, client), group in sorted(group_results(rows).items()):
+        traces = [t for t in (load_trace(r['trace']) for r in group) if t is not None]
+        agg = aggregate_traces(traces)
+        if agg is None:
+            continue
+        overlay = os.path.join(out_dir, network, f'overlay-{client}.{fmt}')
+        plot_overlay(traces, overlay, f'{network} {client}', agg.grid, agg.bands)
+        sections.setdefault(f'{network} / {client}', []).append(overlay)
+
+    for f in files:
+        parts = pathlib.Path(f).parts
+        sections.setdefault(f'{parts[-3]} / {parts[-2]}', []).append(f)
+    return write_index(out_dir, sections)
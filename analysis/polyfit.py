@@ -1,5 +1,6 @@
 import numpy as np 
 from typing import Optional
+from analysis.cache import memoized
 
 def eval_poly(x : float, p : np.ndarray, deg : int) -> float:
     """
@@ -41,14 +42,8 @@ def get_poly_mse(xs, ys, p: np.ndarray, deg: int) -> float:
     assert(len(p) == deg + 1)
     assert(len(xs) == len(ys))
 
-    err : float = 0.0
-    N : int = len(xs) 
-    for i in range(N):
-        x = xs[i]
-        actual : float = ys[i]
-        predict : float = eval_poly(x, p, deg)
-        err += (actual - predict)**2
-    return (err / N)
+    err = np.asarray(ys, dtype=np.float64) - np.polyval(p, np.asarray(xs, dtype=np.float64))
+    return float(np.mean(err**2))
 
 def correct_poly_error(mse: float, p: np.ndarray, deg: int, l: float) -> float:
     """
@@ -69,6 +64,7 @@ def correct_poly_error(mse: float, p: np.ndarray, deg: int, l: float) -> float:
 
     return mse + l * deg * np.sum(p)
 
+@memoized
 def get_best_polys(x, y, brkps, poly_max_deg : int = 3, l : float = 0.7) -> list[np.ndarray]:
     """
     Returns a list of best polynomials (with minimum error) for each segment, 
@@ -100,14 +96,15 @@ def get_best_polys(x, y, brkps, poly_max_deg : int = 3, l : float = 0.7) -> list
         else:
             xs = x[start:brkps[i]]
             ys = y[start:brkps[i]]
-        start = brkps[i]
+            start = brkps[i]
 
         # Iterate through degrees [1, poly_max_deg] and find 
         # polynomial that minimizes error for this segment.
+        # Segments too short for a line get a constant.
         min_error : Optional[float] = None
-        best_poly : np.ndarray
-        for deg in range(1, poly_max_deg + 1):
-            p : np.ndarray = np.polyfit(x, y)
+        best_poly : np.ndarray = np.array([float(np.mean(ys)) if len(ys) else 0.0])
+        for deg in range(1, min(poly_max_deg, len(xs) - 1) + 1):
+            p : np.ndarray = np.polyfit(xs, ys, deg)
             mse : float = get_poly_mse(xs, ys, p, deg)
             err : float = correct_poly_error(mse, p, deg, l)
             if (min_error is None) or err < min_error:
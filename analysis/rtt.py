@@ -0,0 +1,157 @@
+# --- Import external libraries ---
+import numpy as np
+from typing import NamedTuple
+from enum import Enum
+
+# --- Constants ---
+# RFC 9002, Section 5.3: smoothed_rtt and rttvar gains
+SRTT_GAIN   = 1 / 8
+RTTVAR_GAIN = 1 / 4
+
+# Chunk length used by ewma(). Bounds (1 - gain)^-k so that the closed form
+# stays well inside float64 range.
+EWMA_CHUNK = 128
+
+class RTTNormType(Enum):
+    STATIC   = 1  # single handshake RTT sample (legacy behavior)
+    MIN_RTT  = 2  # running min_rtt
+    SMOOTHED = 3  # smoothed_rtt
+
+class RTTSamples(NamedTuple):
+    times:         np.ndarray  # time each sample was taken [ms]
+    latest_rtts:   np.ndarray  # raw per-ACK RTT samples [ms]
+    smoothed_rtts: np.ndarray  # RFC 9002 smoothed_rtt after each sample [ms]
+    min_rtts:      np.ndarray  # RFC 9002 min_rtt after each sample [ms]
+    rttvars:       np.ndarray  # RFC 9002 rttvar after each sample [ms]
+
+# --- Helper Functions ---
+def ewma(x: np.ndarray, gain: float, init: float) -> np.ndarray:
+    """
+    Vectorized exponentially weighted moving average, i.e.
+    y[i] = (1 - gain) * y[i-1] + gain * x[i], with y[-1] = @init.
+
+    The recurrence is evaluated in closed form over chunks of EWMA_CHUNK
+    samples (scaled cumulative sum), carrying the last value across chunks.
+
+    Args:
+        x (np.ndarray):  input samples.
+        gain (float):    weight of each new sample, in (0, 1].
+        init (float):    value of the average before the first sample.
+
+    Return:
+        np.ndarray: averaged series, same length as @x.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.empty_like(x)
+    decay = 1.0 - gain
+    powers = decay ** np.arange(1, EWMA_CHUNK + 1)
+
+    carry = float(init)
+    for start in range(0, len(x), EWMA_CHUNK):
+        chunk = x[start:start + EWMA_CHUNK]
+        p = powers[:len(chunk)]
+        out = p * (carry + gain * np.cumsum(chunk / p))
+        y[start:start + len(chunk)] = out
+        carry = out[-1]
+    return y
+
+# --- RTT Estimation ---
+def estimate_rtt(times: np.ndarray, latest_rtts: np.ndarray,
+                 ack_delays: np.ndarray) -> RTTSamples:
+    """
+    Runs the RFC 9002 (Section 5) RTT estimator over a series of per-ACK RTT
+    samples, without a per-sample Python loop.
+
+    Args:
+        times (np.ndarray):        time each sample was taken [ms].
+        latest_rtts (np.ndarray):  raw RTT samples [ms].
+        ack_delays (np.ndarray):   peer-reported ACK delay per sample [ms]
+                                   (zeros if unknown, e.g. for TCP).
+
+    Return:
+        RTTSamples: latest, smoothed, min RTT and RTT variation per sample.
+    """
+    times       = np.asarray(times, dtype=np.float64)
+    latest_rtts = np.asarray(latest_rtts, dtype=np.float64)
+    ack_delays  = np.asarray(ack_delays, dtype=np.float64)
+    assert(len(times) == len(latest_rtts) == len(ack_delays))
+
+    if len(latest_rtts) == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return RTTSamples(empty, empty, empty, empty, empty)
+
+    # min_rtt ignores ACK delay
+    min_rtts = np.minimum.accumulate(latest_rtts)
+
+    # Subtract ACK delay only if the result does not drop below min_rtt
+    adjusted = latest_rtts - ack_delays
+    adjusted = np.where(latest_rtts >= min_rtts + ack_delays, adjusted, latest_rtts)
+
+    # First sample initializes the estimator (no ACK delay adjustment)
+    first = latest_rtts[0]
+    smoothed = np.empty_like(latest_rtts)
+    smoothed[0] = first
+    smoothed[1:] = ewma(adjusted[1:], SRTT_GAIN, first)
+
+    # rttvar uses the smoothed_rtt *before* each update
+    rttvars = np.empty_like(latest_rtts)
+    rttvars[0] = first / 2
+    rttvars[1:] = ewma(np.abs(smoothed[:-1] - adjusted[1:]), RTTVAR_GAIN, first / 2)
+
+    return RTTSamples(
+        times         = times,
+        latest_rtts   = latest_rtts,
+        smoothed_rtts = smoothed,
+        min_rtts      = min_rtts,
+        rttvars       = rttvars,
+    )
+
+# --- Normalization ---
+def normalize_by_rtt_series(times: np.ndarray, sample_times: np.ndarray,
+                            rtts: np.ndarray) -> np.ndarray:
+    """
+    Normalizes @times by a time-varying RTT, i.e. returns the number of RTTs
+    elapsed at each time: the integral of dt / rtt(t) from 0, where rtt(t) is
+    the step function taking value @rtts[k] from @sample_times[k] onwards
+    (and @rtts[0] before the first sample). With a constant RTT this reduces
+    to times / rtt.
+
+    Args:
+        times (np.ndarray):         times to normalize [ms].
+        sample_times (np.ndarray):  times the RTT estimate changed [ms], sorted.
+        rtts (np.ndarray):          RTT estimate from each sample time on [ms].
+
+    Return:
+        np.ndarray: RTT-normalized times.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    sample_times = np.asarray(sample_times, dtype=np.float64)
+    rtts = np.asarray(rtts, dtype=np.float64)
+    assert(len(sample_times) == len(rtts) and len(rtts) > 0)
+
+    # Elapsed RTTs at each sample time
+    elapsed = np.empty_like(sample_times)
+    elapsed[0] = sample_times[0] / rtts[0]
+    elapsed[1:] = elapsed[0] + np.cumsum(np.diff(sample_times) / rtts[:-1])
+
+    # Piecewise-linear interpolation between sample times
+    idx = np.searchsorted(sample_times, times, side='right') - 1
+    before = (idx < 0)
+    idx = np.clip(idx, 0, None)
+    normalized = elapsed[idx] + (times - sample_times[idx]) / rtts[idx]
+    normalized[before] = times[before] / rtts[0]
+    return normalized
+
+def normalize_by_samples(times: np.ndarray, samples: RTTSamples,
+                         norm: RTTNormType) -> np.ndarray:
+    """
+    Normalizes @times by min_rtt or smoothed_rtt from @samples (see
+    normalize_by_rtt_series).
+    """
+    match norm:
+        case RTTNormType.MIN_RTT:  rtts = samples.min_rtts
+        case RTTNormType.SMOOTHED: rtts = samples.smoothed_rtts
+        case _:
+            print(f'[ERROR] unsupported normalization {norm} for RTT samples')
+            assert(False)  # panic
+    return normalize_by_rtt_series(times, samples.times, rtts)
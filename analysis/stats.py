@@ -0,0 +1,119 @@
+# --- Import external libraries ---
+import math
+import numpy as np
+from typing import NamedTuple
+
+class MannWhitneyResult(NamedTuple):
+    u:           float  # U statistic of the first sample
+    p_value:     float  # two-sided, normal approximation with tie correction
+    effect_size: float  # rank-biserial correlation in [-1, 1], > 0 if the
+                        # first sample tends to be larger
+
+def rankdata(a: np.ndarray) -> np.ndarray:
+    """ Ranks of @a starting at 1, ties receiving the average rank. """
+    a = np.asarray(a)
+    sorter = np.argsort(a, kind='mergesort')
+    inv = np.empty(len(a), dtype=np.int64)
+    inv[sorter] = np.arange(len(a))
+    a = a[sorter]
+    obs = np.concatenate(([True], a[1:] != a[:-1]))
+    dense = np.cumsum(obs)[inv]
+    count = np.concatenate((np.flatnonzero(obs), [len(obs)]))
+    return 0.5 * (count[dense] + count[dense - 1] + 1)
+
+def mann_whitney_u(x: np.ndarray, y: np.ndarray) -> MannWhitneyResult:
+    """
+    Two-sided Mann-Whitney U test of @x against @y.
+
+    Args:
+        x (np.ndarray):  first sample.
+        y (np.ndarray):  second sample.
+
+    Return:
+        MannWhitneyResult: U statistic, p-value and rank-biserial effect size.
+                           The p-value is 1 if either sample is empty.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n1, n2 = len(x), len(y)
+    if (n1 == 0) or (n2 == 0):
+        return MannWhitneyResult(u=float('nan'), p_value=1.0, effect_size=0.0)
+
+    ranks = rankdata(np.concatenate((x, y)))
+    u1 = float(np.sum(ranks[:n1]) - n1 * (n1 + 1) / 2)
+
+    # Tie-corrected standard deviation of U
+    n = n1 + n2
+    _, counts = np.unique(ranks, return_counts=True)
+    tie_term = float(np.sum(counts**3 - counts)) / (n * (n - 1)) if n > 1 else 0.0
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+
+    mu = n1 * n2 / 2
+    if sigma == 0:
+        p_value = 1.0
+    else:
+        z = (abs(u1 - mu) - 0.5) / sigma  # continuity correction
+        p_value = min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+    effect_size = 2 * u1 / (n1 * n2) - 1
+    return MannWhitneyResult(u=u1, p_value=p_value, effect_size=effect_size)
+
+def mann_whitney_min_p(n1: int, n2: int) -> float:
+    """
+    Smallest p-value mann_whitney_u can return for samples of sizes @n1 and
+    @n2 (complete separation, no ties). If it is not below the significance
+    level, no difference can be detected, however large.
+    """
+    return mann_whitney_u(np.arange(n1), np.arange(n1, n1 + n2)).p_value
+
+def holm_adjust(p_values: list[float]) -> list[float]:
+    """
+    Holm-Bonferroni adjusted p-values, in the order of @p_values: rejecting
+    every hypothesis with adjusted p-value below alpha controls the
+    family-wise error rate at alpha.
+    """
+    m = len(p_values)
+    order = np.argsort(p_values, kind='mergesort')
+    adjusted = np.empty(m)
+    running = 0.0
+    for rank, i in enumerate(order):
+        running = max(running, min(1.0, (m - rank) * p_values[i]))
+        adjusted[i] = running
+    return [float(p) for p in adjusted]
+
+class MedianCI(NamedTuple):
+    median:    float
+    low:       float
+    high:      float
+    rel_width: float  # (high - low) / |median|, inf if no interval exists
+
+def median_ci(x: np.ndarray, confidence: float = 0.95) -> MedianCI:
+    """
+    Distribution-free confidence interval of the median of @x from order
+    statistics: the narrowest pair (x_(j), x_(n-j+1)) such that
+    P(j <= B <= n - j) >= @confidence, with B ~ Binomial(n, 1/2).
+
+    Return:
+        MedianCI: median and interval bounds. If @x is too small for the
+                  requested confidence (e.g. fewer than 6 samples at 95%),
+                  the bounds are -inf/inf and rel_width is inf.
+    """
+    x = np.sort(np.asarray(x, dtype=np.float64))
+    x = x[~np.isnan(x)]
+    n = len(x)
+    if n == 0:
+        nan = float('nan')
+        return MedianCI(median=nan, low=nan, high=nan, rel_width=float('inf'))
+    median = float(np.median(x))
+
+    # cdf[k] = P(B <= k)
+    cdf = np.cumsum([math.comb(n, k) for k in range(n + 1)]) / 2.0**n
+    # Largest j (1-based) with coverage 1 - 2 * P(B <= j - 1) >= confidence
+    ok = np.flatnonzero(1 - 2 * cdf[:(n + 1) // 2] >= confidence)
+    if len(ok) == 0:
+        inf = float('inf')
+        return MedianCI(median=median, low=-inf, high=inf, rel_width=inf)
+    j = int(ok[-1]) + 1
+    low, high = float(x[j - 1]), float(x[n - j])
+    rel_width = (high - low) / abs(median) if median != 0 else float('inf')
+    return MedianCI(median=median, low=low, high=high, rel_width=rel_width)
@@ -0,0 +1,188 @@
+# --- Import external libraries ---
+import numpy as np
+from array import array
+from typing import Optional, NamedTuple
+from analysis.analyze import *
+from analysis.loss import is_stream_frame, get_stream_frame_length
+from analysis.demux import split_connections
+
+# --- Constants ---
+HTTP2_DATA_TYPE = '0'
+
+class StreamSummary(NamedTuple):
+    connection:    int
+    stream:        int
+    bytes_acked:   int
+    first_ack_ms:  float
+    completion_ms: float  # time of the last ACK of the stream
+
+# --- Helper Functions ---
+def split_by_stream(times: np.ndarray, ids: np.ndarray, acks: np.ndarray) -> dict[int, CumAckTime]:
+    """ Splits flat (time, stream id, bytes) rows into one time-sorted CumAckTime per stream. """
+    out: dict[int, CumAckTime] = {}
+    if len(times) == 0:
+        return out
+    order = np.lexsort((times, ids))  # by stream, then time
+    times, ids, acks = times[order], ids[order], acks[order]
+    bounds = np.flatnonzero(np.diff(ids)) + 1
+    for t, i, a in zip(np.split(times, bounds), np.split(ids, bounds), np.split(acks, bounds)):
+        out[int(i[0])] = CumAckTime(times=t, acks=a)
+    return out
+
+def iter_http2_frames(http2):
+    """ Yields every HTTP/2 frame of a packet's http2 layer(s). """
+    records = http2 if (type(http2) == list) else [http2]
+    for record in records:
+        frames = record.get('http2.stream') or []
+        if (type(frames) == dict):
+            frames = [frames]
+        yield from frames
+
+# --- QUIC ---
+def get_stream_acks_quic(d: list) -> dict[int, CumAckTime]:
+    """
+    Bytes of each stream newly acknowledged by each of our ACKs: the STREAM
+    frames of every packet we receive are credited to their stream when the
+    packet is first covered by one of our ACK frames (same accounting as
+    get_cumack_quic, restricted to stream payload).
+    """
+    # {(packet number space, packet number) : [(stream id, bytes)]}
+    pending: dict[tuple[int, int], list[tuple[int, int]]] = {}
+    times, ids, acks = array('d'), array('q'), array('q')
+
+    for packet in d:
+        layers = packet['_source']['layers']
+        udp = layers.get('udp')
+        quics = layers.get('quic')
+        if (udp is None) or (quics is None):
+            continue
+        time = float(udp['Timestamps']['udp.time_relative']) * 1000  # [ms]
+        is_incoming: bool = (int(udp['udp.srcport']) == 443)
+        if (type(quics) == dict):
+            quics = [quics]
+
+        for quic in quics:
+            pn_space: int = get_quic_pn_space(quic)
+            frames = quic.get('quic.frame') or []
+            if (type(frames) == dict):
+                frames = [frames]
+
+            if is_incoming:
+                pkt_num = get_quic_field(quic, 'quic.packet_number')
+                if pkt_num is None:
+                    continue
+                key = (pn_space, int(pkt_num))
+                for frame in frames:
+                    if is_stream_frame(frame['quic.frame_type']):
+                        pending.setdefault(key, []).append(
+                            (int(frame['quic.stream.stream_id']), get_stream_frame_length(frame)))
+                continue
+
+            for frame in frames:
+                if (frame['quic.frame_type'] != ACK_TYPE):
+                    continue
+                ack_target = int(frame['quic.ack.largest_acknowledged'])
+                ack_range  = int(frame['quic.ack.first_ack_range'])
+                for pkt_num in range(ack_target - ack_range, ack_target + 1):
+                    for stream_id, length in pending.pop((pn_space, pkt_num), []):
+                        times.append(time)
+                        ids.append(stream_id)
+                        acks.append(length)
+
+    return split_by_stream(np.frombuffer(times, dtype=np.float64),
+                           np.frombuffer(ids, dtype=np.int64),
+                           np.frombuffer(acks, dtype=np.int64))
+
+# --- TCP (HTTP/2) ---
+def get_stream_acks_tcp(d: list) -> dict[int, CumAckTime]:
+    """
+    Bytes of each HTTP/2 stream newly acknowledged by each of our ACKs. DATA
+    frames are attributed to the segment that completes them, and credited
+    at the first of our ACKs covering the end of that segment. Requires the
+    http2 layer (traces decoded with the TLS key log, see read_pcap).
+    """
+    seg_ends, seg_ids, seg_lens = array('q'), array('q'), array('q')
+    ack_times, ack_nums = array('d'), array('q')
+
+    for packet in d:
+        layers = packet['_source']['layers']
+        tcp = layers['tcp']
+        if int(tcp['tcp.srcport']) == 443:
+            http2 = layers.get('http2')
+            if http2 is None:
+                continue
+            end = int(tcp['tcp.seq']) + int(tcp.get('tcp.len', 0))
+            for frame in iter_http2_frames(http2):
+                if (frame.get('http2.type') != HTTP2_DATA_TYPE):
+                    continue
+                seg_ends.append(end)
+                seg_ids.append(int(frame['http2.streamid']))
+                seg_lens.append(int(frame.get('http2.length', 0)))
+        elif tcp['tcp.flags_tree'].get('tcp.flags.ack') == '1':
+            ack_times.append(float(tcp['Timestamps']['tcp.time_relative']) * 1000)  # [ms]
+            ack_nums.append(int(tcp['tcp.ack']))
+
+    ends = np.frombuffer(seg_ends, dtype=np.int64)
+    ack_times = np.frombuffer(ack_times, dtype=np.float64)
+    if (len(ends) == 0) or (len(ack_times) == 0):
+        return {}
+
+    # Running maximum of the cumulative ACK is sorted: first covering ACK
+    # of every segment is a searchsorted.
+    high = np.maximum.accumulate(np.frombuffer(ack_nums, dtype=np.int64))
+    idx = np.searchsorted(high, ends, side='left')
+    acked = idx < len(high)
+    return split_by_stream(ack_times[idx[acked]],
+                           np.frombuffer(seg_ids, dtype=np.int64)[acked],
+                           np.frombuffer(seg_lens, dtype=np.int64)[acked])
+
+def get_stream_acks(d: list, type: ProtocolType) -> dict[int, CumAckTime]:
+    match type:
+        case ProtocolType.PROTOCOL_TCP:  return get_stream_acks_tcp(d)
+        case ProtocolType.PROTOCOL_QUIC: return get_stream_acks_quic(d)
+
+# --- Per-Stream Traces ---
+def stream_traces_from_packets(d: list, type: ProtocolType,
+                               norm: RTTNormType = RTTNormType.STATIC) -> dict[int, CumAckRTT]:
+    """
+    Per-stream CumAckRTT traces of one connection, on the RTT-normalized time
+    axis of the whole connection (so streams can be compared directly).
+    """
+    conn = cumack_rtt_from_packets(d, type, norm)
+    if (conn is None) or (len(conn) == 0):
+        return {}
+    return {stream_id: CumAckRTT(times=s.times, acks=s.acks,
+                                 rtts=np.interp(s.times, conn.times, conn.rtts))
+            for stream_id, s in get_stream_acks(d, type).items()}
+
+def all_stream_traces(d: list, type: ProtocolType,
+                      norm: RTTNormType = RTTNormType.STATIC) -> dict[tuple[int, int], CumAckRTT]:
+    """
+    Per-stream CumAckRTT traces of every connection of a parsed trace (e.g.
+    a multi-stream or parallel-connection workload), keyed by
+    (connection index, stream id).
+    """
+    out = {}
+    for conn in split_connections(d, type):
+        for stream_id, trace in stream_traces_from_packets(conn.packets, type, norm).items():
+            out[(conn.index, stream_id)] = trace
+    return out
+
+def get_stream_traces(pcap_file: str, type: ProtocolType,
+                      norm: RTTNormType = RTTNormType.STATIC) -> dict[tuple[int, int], CumAckRTT]:
+    """ Same as all_stream_traces, for the JSON packet trace @pcap_file. """
+    d = pcap_file_to_json(pcap_file)
+    return all_stream_traces(d, type, norm) if d else {}
+
+def summarize_streams(traces: dict[tuple[int, int], CumAckRTT]) -> list[StreamSummary]:
+    """
+    Bytes and completion time of every stream, sorted by completion. The
+    spread of completion times across streams of equal size is a direct
+    measure of head-of-line blocking.
+    """
+    rows = [StreamSummary(connection=conn, stream=stream,
+                          bytes_acked=int(t.cum_acks[-1]),
+                          first_ack_ms=float(t.times[0]),
+                          completion_ms=float(t.times[-1]))
+            for (conn, stream), t in traces.items() if len(t) > 0]
+    return sorted(rows, key=lambda r: r.completion_ms)
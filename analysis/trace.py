@@ -0,0 +1,100 @@
+# --- Import external libraries ---
+import json
+import numpy as np
+from typing import Optional
+from utils.compress import open_text
+
+class CumAckRTT:
+    """
+    Cumulative-ACK trace backed by contiguous NumPy arrays: times (in ms,
+    float64), bytes ACKed (int64) and RTT-normalized times (float64), i.e.
+    24 bytes per sample. Cumulative bytes ACKed are computed on first use
+    with np.cumsum. Slicing with segment() returns views, not copies.
+    """
+    __slots__ = ('times', 'acks', 'rtts', '_cum_acks')
+
+    def __init__(self, times, acks, rtts, cum_acks: Optional[np.ndarray] = None):
+        self.times: np.ndarray = np.ascontiguousarray(times, dtype=np.float64)
+        self.acks:  np.ndarray = np.ascontiguousarray(acks, dtype=np.int64)
+        self.rtts:  np.ndarray = np.ascontiguousarray(rtts, dtype=np.float64)
+        self._cum_acks: Optional[np.ndarray] = cum_acks
+        assert(len(self.times) == len(self.acks))
+        assert(len(self.times) == len(self.rtts))
+
+    @property
+    def cum_acks(self) -> np.ndarray:
+        if self._cum_acks is None:
+            self._cum_acks = np.cumsum(self.acks, dtype=np.int64)
+        return self._cum_acks
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __repr__(self) -> str:
+        total = int(self.cum_acks[-1]) if len(self) > 0 else 0
+        return f'CumAckRTT(samples={len(self)}, bytes_acked={total})'
+
+    def segment(self, start: int, stop: Optional[int] = None) -> 'CumAckRTT':
+        """
+        Returns samples [@start, @stop) as views into this trace. Cumulative
+        bytes ACKed stay relative to the start of the whole trace.
+        """
+        return CumAckRTT(
+            times    = self.times[start:stop],
+            acks     = self.acks[start:stop],
+            rtts     = self.rtts[start:stop],
+            cum_acks = self.cum_acks[start:stop],
+        )
+
+    def segments(self, brkps: list) -> list['CumAckRTT']:
+        """
+        Returns the segments delimited by breakpoints @brkps (indices, as
+        returned by the changepoint algorithms), as views.
+        """
+        bounds = [0] + [b for b in brkps if 0 < b < len(self)] + [len(self)]
+        return [self.segment(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+    # --- Cache format ---
+    def to_dict(self) -> dict:
+        return {
+            'times':    self.times.tolist(),
+            'acks':     self.acks.tolist(),
+            'cum_acks': self.cum_acks.tolist(),
+            'rtts':     self.rtts.tolist(),
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> 'CumAckRTT':
+        """
+        Builds a trace from the cache format. Older cache files only hold
+        'rtts' and 'cum_acks'; missing fields are derived from those.
+        """
+        rtts = np.asarray(d['rtts'], dtype=np.float64)
+        cum_acks = d.get('cum_acks')
+        if cum_acks is not None:
+            cum_acks = np.asarray(cum_acks, dtype=np.int64)
+
+        acks = d.get('acks')
+        if acks is None:
+            acks = np.diff(cum_acks, prepend=0)
+        times = d.get('times')
+        if times is None:
+            times = np.full(len(rtts), np.nan)
+        return CumAckRTT(times=times, acks=acks, rtts=rtts, cum_acks=cum_acks)
+
+def save_trace(trace: CumAckRTT, path: str):
+    """ 
+    Writes @trace to @path in the cache format (JSON), compressed if @path 
+    ends in .zst or .gz.
+    """
+    with open_text(path, 'w') as f:
+        json.dump(trace.to_dict(), f)
+
+def load_trace(path: str) -> Optional[CumAckRTT]:
+    """ Reads a trace in the cache format from @path. """
+    try:
+        with open_text(path) as f:
+            return CumAckRTT.from_dict(json.load(f))
+    except OSError:
+        print(f'[ERROR] could not open file: {path}, exiting.')
+        return None
@@ -0,0 +1,397 @@
+import os
+import json
+import time
+import zlib
+import random
+import socket
+import pathlib
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from multiprocessing.connection import Listener, Client, Connection
+from typing import NamedTuple
+from network.generate_cmds import generate_cmds, network_config_name
+from clients.run_clients import PCAP_OUT_DIR, SEQUENTIAL_OBJECT_CLIENTS, get_workload, \
+                                workload_name, run_client
+
+# Coordinator defaults. Messages are pickles, so anyone holding the key can
+# run code on the coordinator and workers: there is no default key, and the
+# coordinator only listens on localhost unless told otherwise.
+DEFAULT_ADDRESS = ('127.0.0.1', 6000)
+AUTHKEY_ENV = 'QUIC_AUTOMATED_AUTHKEY'  # read if --authkey is not given
+MAX_ATTEMPTS = 3         # runs of a task before it is given up
+TASK_TIMEOUT = 600.0     # seconds before an unfinished task is handed out again
+RESULTS_FILE = 'results.json'
+MANIFEST_FILE = 'manifest.json'
+
+# One capture: one iteration of one client under one network config.
+class Task(NamedTuple):
+    task_id:   str   # '<network>/<client>/<iteration>', unique in a sweep
+    network:   dict  # network parameters (see generate_cmds)
+    client:    str
+    endpoint:  str
+    workload:  dict
+    codec:     str
+    iteration: int
+
+# Network configs of a config file: 'networks' (list) or 'network'.
+def get_network_configs(d: dict) -> list[dict]:
+    networks = d.get('networks')
+    if networks is None:
+        networks = [d['network']] if d.get('network') is not None else []
+    return networks
+
+# Split the job matrix of a config file into tasks, grouped by network
+# config so that workers reshape their link as rarely as possible.
+def task_matrix(config_file: str) -> list[Task]:
+    with open(config_file) as f:
+        d = json.load(f)
+
+    workload = get_workload(d.get('workload'))
+    name = workload_name(workload)
+    tasks = []
+    for network in get_network_configs(d):
+        for client in d.get('clients') or []:
+            if (workload['objects'] > 1) and (client not in SEQUENTIAL_OBJECT_CLIENTS):
+                print(f'Warning: {client} cannot request objects sequentially, skipped')
+                continue
+            label = f'{client}-{name}' if name else client
+            for i in range(d.get('iters') or 1):
+                tasks.append(Task(
+                    task_id   = f'{network_config_name(network)}/{label}/{i}',
+                    network   = network,
+                    client    = client,
+                    endpoint  = d['endpoint'],
+                    workload  = workload,
+                    codec     = d.get('compression') or 'zstd',
+                    iteration = i,
+                ))
+    return tasks
+
+# Parse 'host:port' into an address for Listener/Client.
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(':')
+    return (host or DEFAULT_ADDRESS[0], int(port))
+
+# --- Worker ---
+
+# Apply network parameters to this host's interfaces (see generate_cmds).
+def shape_network(network: dict):
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump({'network': network}, f)
+    try:
+        for cmd in generate_cmds(f.name):
+            subprocess.run(cmd, shell=True, capture_output=True)
+    finally:
+        os.remove(f.name)
+
+# Compact form of a trace: its three arrays, sent instead of the raw JSON.
+def trace_arrays(trace) -> tuple:
+    return (trace.times, trace.acks, trace.rtts)
+
+# Capture and analyze one task on this host. Returns the summary rows
+# (see analysis.batch.analyze_trace) and the trace arrays of each
+# connection, keyed by connection index.
+def run_task(task: Task, cache_dir: str) -> dict:
+    from analysis.batch import analyze_trace
+    from analysis.trace import load_trace
+
+    out_dir = PCAP_OUT_DIR.joinpath(network_config_name(task.network))
+    outputs = run_client(task.client, task.endpoint, 1, out_dir, task.codec, task.workload)
+    if not outputs:
+        raise RuntimeError(f'client {task.client} produced no trace')
+
+    rows = analyze_trace(outputs[0], cache_dir=cache_dir, codec=task.codec)
+    traces = {}
+    for row in rows:
+        trace = load_trace(row['trace']) if row['trace'] else None
+        if trace is not None:
+            traces[row['connection']] = trace_arrays(trace)
+    return {'rows': rows, 'traces': traces}
+
+# Stand-in for run_task without shaping or capture: a synthetic transfer
+# (slow start, then the link rate) derived from the task, analyzed like a
+# real trace. Used to test the coordinator with local workers.
+def run_task_dry(task: Task) -> dict:
+    import numpy as np
+    from analysis.trace import CumAckRTT
+    from analysis.changepoint import CDAType, get_cp_decimated
+    from analysis.metrics import get_metrics
+    from analysis.batch import P
+
+    rng = np.random.default_rng(zlib.crc32(task.task_id.encode()))
+    rtt = float(task.network.get('delay') or 50)
+    bw = float(task.network.get('bw') or 100) * 1000 / 8  # [bytes/ms]
+    times = np.arange(rtt, rtt * 40, 1.0)
+    rate = np.minimum(bw, 1460 * 2.0 ** ((times - rtt) / rtt) / rtt)
+    acks = np.maximum(rate * rng.uniform(0.8, 1.2, len(times)), 0).astype(np.int64)
+    trace = CumAckRTT(times=times, acks=acks, rtts=times / rtt)
+
+    row = {
+        'path':         f'dry-run/{task.task_id}.json',
+        'client':       task.client,
+        'network':      network_config_name(task.network),
+        'protocol':     'PROTOCOL_TCP' if 'h2' in task.client else 'PROTOCOL_QUIC',
+        'connection':   0,
+        'aborted':      False,
+        'flow':         'dry-run',
+        'packets':      len(trace),
+        'samples':      len(trace),
+        'bytes_acked':  int(trace.cum_acks[-1]),
+        'duration_ms':  float(times[-1] - times[0]),
+        'bkps':         [int(b) for b in get_cp_decimated(trace.rtts, trace.cum_acks,
+                                                          CDAType.PELT, P)],
+        'loss':         {},
+        'segment_loss': [],
+        'metrics':      get_metrics(trace, float(task.network.get('bw') or 0) or None),
+        'trace':        None,
+    }
+    return {'rows': [row], 'traces': {0: trace_arrays(trace)}}
+
+# Connect to a coordinator and run tasks until told to stop. With dry_run,
+# tasks are simulated (see run_task_dry); fail_prob makes tasks fail at
+# random, to exercise retries.
+def run_worker(address: tuple[str, int], authkey: bytes,
+               dry_run: bool = False, fail_prob: float = 0.0, name: str | None = None):
+    name = name or f'{socket.gethostname()}:{os.getpid()}'
+    cache_dir = tempfile.mkdtemp(prefix='quic-automated-')
+    shaped = None  # network config currently applied
+    with Client(address, authkey=authkey) as conn:
+        conn.send(('hello', name))
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                break
+            if msg[0] == 'stop':
+                break
+
+            task: Task = msg[1]
+            print(f'[{name}] running {task.task_id}')
+            try:
+                if random.random() < fail_prob:
+                    raise RuntimeError('simulated failure')
+                if dry_run:
+                    payload = run_task_dry(task)
+                else:
+                    if shaped != task.network:
+                        shape_network(task.network)
+                        shaped = task.network
+                    payload = run_task(task, cache_dir)
+                conn.send(('result', task.task_id, payload))
+            except Exception as e:
+                conn.send(('failed', task.task_id, repr(e)))
+
+# --- Coordinator ---
+
+# Hands out tasks to workers, retries failed or lost tasks, and keeps the
+# first result of each task. Results are written to out_dir as a results
+# file (same format as analyze) with traces in out_dir/cache/, and a
+# manifest of task states; tasks already in the manifest are not rerun.
+class Coordinator:
+    def __init__(self, tasks: list[Task], out_dir: str, max_attempts: int = MAX_ATTEMPTS,
+                 task_timeout: float = TASK_TIMEOUT):
+        self.out_dir = pathlib.Path(out_dir)
+        self.cache_dir = self.out_dir.joinpath('cache')
+        self.max_attempts = max_attempts
+        self.task_timeout = task_timeout
+        self.lock = threading.Condition()
+
+        self.tasks = {task.task_id: task for task in tasks}
+        self.attempts: dict[str, int] = {task_id: 0 for task_id in self.tasks}
+        self.in_flight: dict[str, tuple[str, float]] = {}  # task id -> (worker, start)
+        self.done: dict[str, str] = {}     # task id -> worker
+        self.failed: dict[str, str] = {}   # task id -> last error
+        self.rows: list[dict] = []
+        self.load()
+        self.pending: list[str] = [t for t in self.tasks if t not in self.done]
+
+    # Resume from a previous run in the same out_dir.
+    def load(self):
+        manifest = self.out_dir.joinpath(MANIFEST_FILE)
+        results = self.out_dir.joinpath(RESULTS_FILE)
+        if not (manifest.exists() and results.exists()):
+            return
+        with open(manifest) as f:
+            done = json.load(f).get('done', {})
+        with open(results) as f:
+            rows = json.load(f)
+        self.done = {t: w for t, w in done.items() if t in self.tasks}
+        self.rows = [row for row in rows if row.get('task') in self.done]
+
+    def save(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        rows = sorted(self.rows, key=lambda row: (row['task'], row['connection']))
+        with open(self.out_dir.joinpath(RESULTS_FILE), 'w') as f:
+            json.dump(rows, f, indent=1)
+        with open(self.out_dir.joinpath(MANIFEST_FILE), 'w') as f:
+            json.dump({'done': self.done, 'failed': self.failed,
+                       'attempts': self.attempts}, f, indent=1)
+
+    @property
+    def finished(self) -> bool:
+        return len(self.done) + len(self.failed) == len(self.tasks)
+
+    # Tasks running past task_timeout are handed out again (first result 
+    # wins), or given up if they have had max_attempts runs already. Called
+    # with the lock held.
+    def check_timeouts(self):
+        now = time.monotonic()
+        for task_id, (worker, start) in list(self.in_flight.items()):
+            if (now - start <= self.task_timeout) or (task_id in self.pending):
+                continue
+            if self.attempts[task_id] < self.max_attempts:
+                print(f'[coordinator] {task_id} timed out, handing it out again')
+                self.pending.append(task_id)
+            else:
+                print(f'[coordinator] {task_id} timed out on {worker}, giving up')
+                del self.in_flight[task_id]
+                self.failed[task_id] = f'timed out on {worker}'
+                self.save()
+                self.lock.notify_all()
+
+    # Next task for a worker, preferring the network config it already has.
+    # Returns None if nothing is left to do.
+    def next_task(self, worker: str, network: dict | None) -> Task | None:
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.check_timeouts()
+                if self.pending:
+                    same = [t for t in self.pending if self.tasks[t].network == network]
+                    task_id = (same or self.pending)[0]
+                    self.pending.remove(task_id)
+                    self.attempts[task_id] += 1
+                    self.in_flight[task_id] = (worker, now)
+                    return self.tasks[task_id]
+                if self.finished:
+                    return None
+                self.lock.wait(timeout=1.0)
+
+    # A task did not complete: retry it, or give up after max_attempts.
+    def task_failed(self, task_id: str, worker: str, error: str):
+        with self.lock:
+            print(f'[coordinator] {task_id} failed on {worker}: {error}')
+            if (task_id in self.done) or (task_id in self.pending):
+                return
+            if self.in_flight.get(task_id, (None,))[0] == worker:
+                del self.in_flight[task_id]
+            if task_id in self.in_flight:
+                return  # another copy is still running
+            if self.attempts[task_id] < self.max_attempts:
+                self.pending.append(task_id)
+            else:
+                self.failed[task_id] = error
+                self.save()
+            self.lock.notify_all()
+
+    def task_done(self, task_id: str, worker: str, payload: dict):
+        from analysis.trace import CumAckRTT, save_trace
+        from utils.compress import SUFFIXES, resolve_codec
+
+        with self.lock:
+            if task_id in self.done:  # duplicate of a timed-out task
+                return
+            task = self.tasks[task_id]
+            suffix = SUFFIXES[resolve_codec(task.codec)]
+            for row in payload['rows']:
+                row['task'], row['host'], row['trace'] = task_id, worker, None
+                arrays = payload['traces'].get(row['connection'])
+                if arrays is not None:
+                    trace_file = self.cache_dir.joinpath(
+                        f'{task_id}-conn{row["connection"]}.trace.json{suffix}')
+                    trace_file.parent.mkdir(parents=True, exist_ok=True)
+                    save_trace(CumAckRTT(*arrays), str(trace_file))
+                    row['trace'] = str(trace_file)
+                self.rows.append(row)
+            self.done[task_id] = worker
+            self.in_flight.pop(task_id, None)
+            if task_id in self.pending:
+                self.pending.remove(task_id)
+            self.failed.pop(task_id, None)
+            self.save()
+            print(f'[coordinator] {task_id} done on {worker} '
+                  f'({len(self.done)}/{len(self.tasks)})')
+            self.lock.notify_all()
+
+    # Serve one worker connection until the sweep is finished.
+    def serve(self, conn: Connection):
+        worker, task = '?', None
+        try:
+            _, worker = conn.recv()
+            print(f'[coordinator] worker {worker} connected')
+            network = None
+            while True:
+                task = self.next_task(worker, network)
+                if task is None:
+                    conn.send(('stop',))
+                    break
+                conn.send(('task', task))
+                msg = conn.recv()
+                if msg[0] == 'result':
+                    self.task_done(msg[1], worker, msg[2])
+                else:
+                    self.task_failed(msg[1], worker, msg[2])
+                network, task = task.network, None
+        except (EOFError, OSError) as e:
+            print(f'[coordinator] lost worker {worker}')
+            if task is not None:
+                self.task_failed(task.task_id, worker, f'worker lost ({e!r})')
+        finally:
+            conn.close()
+
+    # Accept workers on address until every task is done or given up.
+    def run(self, address: tuple[str, int], authkey: bytes) -> Listener:
+        self.save()
+        listener = Listener(address, authkey=authkey)
+        print(f'[coordinator] {len(self.pending)} task(s) pending, '
+              f'listening on {listener.address}')
+
+        def accept():
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError):
+                    break  # listener closed
+                threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        return listener
+
+    def wait(self, listener: Listener):
+        with self.lock:
+            while not self.finished:
+                self.check_timeouts()  # also when every worker is stuck
+                self.lock.wait(timeout=1.0)
+        time.sleep(0.5)  # let workers receive 'stop'
+        listener.close()
+
+# Run a whole sweep: coordinator on address, plus num_local local worker
+# processes (0 for remote workers only). Returns the coordinator.
+def run_distributed(config_file: str, out_dir: str, authkey: bytes,
+                    address: tuple[str, int] = DEFAULT_ADDRESS, num_local: int = 0,
+                    dry_run: bool = False, fail_prob: float = 0.0,
+                    max_attempts: int = MAX_ATTEMPTS,
+                    task_timeout: float = TASK_TIMEOUT) -> Coordinator:
+    coordinator = Coordinator(task_matrix(config_file), out_dir, max_attempts, task_timeout)
+    listener = coordinator.run(address, authkey)
+
+    host, port = listener.address
+    workers = [multiprocessing.Process(
+                   target=run_worker,
+                   args=(('127.0.0.1' if host == '0.0.0.0' else host, port), authkey,
+                         dry_run, fail_prob, f'local-{i}'))
+               for i in range(num_local)]
+    for worker in workers:
+        worker.start()
+
+    coordinator.wait(listener)
+    for worker in workers:
+        worker.join(timeout=10)
+        if worker.is_alive():
+            worker.terminate()
+
+    print(f'[coordinator] {len(coordinator.done)} task(s) done, '
+          f'{len(coordinator.failed)} failed, results in {out_dir}')
+    return coordinator
@@ -2,8 +2,13 @@ import os
 import json
 import time
 import pathlib
+import shutil
+import tempfile
 import subprocess
+import threading
 from urllib.parse import urlparse
+from network.generate_cmds import network_config_name
+from utils.compress import SUFFIXES, open_stream, resolve_codec
 
 # Directories
 ROOT_DIR = pathlib.Path(__file__).parent.parent.absolute()
@@ -15,6 +20,47 @@ DIRS = [TMP_PCAP_DIR, PCAP_OUT_DIR, SSL_KEY_LOG_DIR]
 PROXYGEN_EXEC_PATH = '/home/shchien/proxygen/proxygen/_build/proxygen/httpserver/hq'
 NGTCP2_EXEC_PATH = '/home/shchien/ngtcp2/examples/wsslclient'
 
+# Workload of each run: @streams concurrent requests on each connection,
+# @objects requested one after the other on each stream, over @connections
+# parallel connections. Object sizes are cycled over the requests and
+# substituted for {size} in the endpoint; empty means the endpoint as is.
+DEFAULT_WORKLOAD = {
+    'streams': 1,
+    'objects': 1,
+    'connections': 1,
+    'sizes': [],
+}
+ABORTED_TAG = '-aborted'
+
+# Clients able to request objects one after the other on a stream; hq and
+# ngtcp2 open one stream per URL at once, so objects > 1 would turn into 
+# extra concurrent streams (a different workload) and is rejected for them.
+SEQUENTIAL_OBJECT_CLIENTS = ['curl_h2']
+
+# Adaptive iterations: after min_iters runs, keep running until the 
+# confidence interval of the median completion time and goodput is at most
+# target_ci (relative to the median) wide, or max_iters runs are done.
+DEFAULT_ADAPTIVE = {
+    'enabled': False,
+    'min_iters': 6,
+    'max_iters': 30,
+    'target_ci': 0.1,
+    'confidence': 0.95,
+}
+
+# Online changepoint detection: follow each run with a live tshark pipe and
+# report phase transitions as they happen; with abort_on_steady, stop the 
+# client once one phase has lasted steady_rtts RTTs. Aborted runs are 
+# truncated: their traces are named out-<time>-aborted.json (see 
+# analysis.batch.is_aborted), left out of completion-based statistics, and
+# not counted by adaptive iterations.
+DEFAULT_ONLINE = {
+    'enabled': False,
+    'abort_on_steady': False,
+    'steady_rtts': 20,
+    'interface': 'eth0',
+}
+
 # Make all directories in DIRS (if they don't exist)
 def make_dirs(DIRS: list[str]):
     for DIR in DIRS:
@@ -34,9 +80,10 @@ def run_pcap(pcap_file: str, url_host: str, url_port: str | None, url_path: str,
     ], env=env)
     return process
 
-# Convert pcap file into JSON, returns process exit
+# Convert pcap file into JSON, returns process exit.
+# The JSON is compressed while streaming if json_file ends in .zst or .gz.
 def read_pcap(is_h3: bool, pcap_file: str, json_file: str, ssl_key_log_file: str, 
-              env) -> str:
+              env) -> subprocess.CompletedProcess:
     if is_h3:  # filter for QUIC packets
         cmd = ' '.join([
             'tshark',
@@ -44,33 +91,70 @@ def read_pcap(is_h3: bool, pcap_file: str, json_file: str, ssl_key_log_file: str
             '-T json',          # output format = JSON
             f'-o tls.keylog_file:{ssl_key_log_file}', # points to TLS secrets
             '--no-duplicate-keys', # combines all duplicate keys into one array
-            f'> {json_file}'   # write JSON file
         ])
     else:  # filter for TCP packets
         cmd = ' '.join([
             'tshark',
             f'-r {pcap_file}',   # read pcap file
             '-T json',           # output format = JSON
-            '-J tcp',            # combines all duplicate keys into one array
-            '--no-duplicate-keys',
-            f'> {json_file}'    # write JSON file
+            f'-o tls.keylog_file:{ssl_key_log_file}', # decrypt HTTP/2 (per-stream bytes)
+            '-J "frame ip ipv6 tcp http2"', # only keep IP, TCP and HTTP/2 layers
+            '--no-duplicate-keys', # combines all duplicate keys into one array
         ])
 
-    output = subprocess.run([cmd],
-                            capture_output=True, 
-                            shell=True, env=env)
-    return output
+    # write JSON file, compressing tshark output as it is produced;
+    # stderr goes to a temporary file so that warnings cannot fill a pipe
+    with tempfile.TemporaryFile() as err:
+        process = subprocess.Popen([cmd], stdout=subprocess.PIPE, 
+                                   stderr=err, shell=True, env=env)
+        with open_stream(json_file, 'wb') as f:
+            shutil.copyfileobj(process.stdout, f)
+        returncode = process.wait()
+        err.seek(0)
+        stderr = err.read()
+    return subprocess.CompletedProcess(cmd, returncode, None, stderr)
+
+# Fill in defaults of a workload from param.json.
+def get_workload(workload: dict | None) -> dict:
+    ret = dict(DEFAULT_WORKLOAD)
+    ret.update(workload or {})
+    return ret
+
+# Name of a workload, used to label its traces ('' for the default workload).
+def workload_name(workload: dict) -> str:
+    workload = get_workload(workload)
+    if workload == DEFAULT_WORKLOAD:
+        return ''
+    name = f'{workload["streams"]}s{workload["objects"]}o{workload["connections"]}c'
+    if workload['sizes']:
+        name += '-' + '+'.join(map(str, workload['sizes']))
+    return name
 
-# Generate commands for client targeting endpoint.
-# Returns [] if client string is invalid.
-def client_cmds(client: str, endpoint: str, url_host: str, url_port: str | None, 
-                url_path: str) -> list[str]:
+# URLs requested on each connection: streams * objects requests, 
+# with object sizes cycled over them.
+def workload_urls(endpoint: str, workload: dict) -> list[str]:
+    workload = get_workload(workload)
+    num_requests = workload['streams'] * workload['objects']
+    sizes = workload['sizes']
+    if not sizes:
+        return [endpoint] * num_requests
+    return [endpoint.format(size=sizes[i % len(sizes)]) for i in range(num_requests)]
+
+# Generate commands for client fetching urls over one connection, with at 
+# most streams requests in flight. Returns [] if client string is invalid.
+# hq and ngtcp2 open one stream per URL at once (see 
+# SEQUENTIAL_OBJECT_CLIENTS); curl honors both.
+def client_cmds(client: str, urls: list[str], url_host: str, url_port: str | None, 
+                streams: int = 1) -> list[str]:
     cmds = []
     match client:
         case 'curl_h2':
             cmds.append('curl')      
             cmds.append('--http2')   # use http2
-            cmds.append(endpoint)    # target endpoint
+            if len(urls) > 1:
+                cmds.append('--parallel')  # multiplex over one connection
+                cmds.append(f'--parallel-max={streams}')  # concurrent streams
+            cmds.extend(urls)        # target endpoints
 
         case 'proxygen_h3':
             cmds.append(PROXYGEN_EXEC_PATH)  
@@ -79,23 +163,87 @@ def client_cmds(client: str, endpoint: str, url_host: str, url_port: str | None,
             cmds.append('--quic_version=1')           # use quic version 1
             cmds.append(f'--host={url_host}')         # host
             cmds.append(f'--port={url_port or 443}')  # port (default to 443)
-            cmds.append(f'--path={url_path}')         # path
+            cmds.append(f'--path={",".join(urlparse(url).path for url in urls)}')  # paths
 
         case 'ngtcp2_h3':  
             cmds.append(NGTCP2_EXEC_PATH)
             cmds.append('--exit-on-all-streams-close')  # close all streams upon exit
             cmds.append(f'{url_host}')         # host
             cmds.append(f'{url_port or 443}')  # port (default to 443)
-            cmds.append(f'{endpoint}')         # complete url
+            cmds.extend(urls)                  # complete urls
 
         case _:  # invalid client provided, return []
             pass
 
     return cmds
 
-# Run client iters-many times.
+# Fill in defaults of adaptive iteration settings from param.json.
+def get_adaptive(adaptive: dict | None) -> dict:
+    ret = dict(DEFAULT_ADAPTIVE)
+    ret.update(adaptive or {})
+    return ret
+
+# Fill in defaults of online detection settings from param.json.
+def get_online(online: dict | None) -> dict:
+    ret = dict(DEFAULT_ONLINE)
+    ret.update(online or {})
+    return ret
+
+# Report a phase transition found by online detection.
+def print_phase_change(change) -> None:
+    print(f'Phase change at {change.time:.0f} ms ({change.rtts:.0f} RTTs): '
+          f'{change.phase_rate:.0f} -> {change.rate:.0f} bytes/RTT')
+
+# Completion time [ms] and goodput [Mbps] of one run: all connections of 
+# the trace, from the first packet until the last byte ACKed.
+# Returns None if the trace holds no usable connection.
+def get_run_metrics(json_file: str) -> dict[str, float] | None:
+    from analysis.analyze import pcap_file_to_json, detect_protocol, cumack_rtt_from_packets
+    from analysis.demux import split_connections
+    from analysis.metrics import completion_time
+
+    d = pcap_file_to_json(json_file)
+    if not d:
+        return None
+    type = detect_protocol(d)
+    completion, bytes_acked = 0.0, 0
+    for conn in split_connections(d, type):
+        trace = cumack_rtt_from_packets(conn.packets, type)
+        if (trace is None) or (len(trace) == 0):
+            continue
+        completion = max(completion, completion_time(trace))
+        bytes_acked += int(trace.cum_acks[-1])
+    if not (completion > 0):
+        return None
+    return {
+        'completion_ms': completion,
+        'goodput_mbps':  bytes_acked * 8 / (completion * 1000),  # bytes/ms -> Mbps
+    }
+
+# True once the median of every metric in samples is known to within 
+# target_ci (relative width of its confidence interval).
+def is_converged(samples: dict[str, list[float]], target_ci: float, 
+                 confidence: float) -> bool:
+    from analysis.stats import median_ci
+
+    converged = True
+    for metric, values in samples.items():
+        ci = median_ci(values, confidence)
+        print(f'{metric}: median {ci.median:.2f}, {confidence:.0%} CI '
+              f'[{ci.low:.2f}, {ci.high:.2f}] ({ci.rel_width:.1%} of median)')
+        converged = converged and (ci.rel_width <= target_ci)
+    return converged
+
+# Run client iters-many times, writing traces to out_dir/<client>/ 
+# (out_dir/<client>-<workload name>/ for other than the default workload), 
+# compressed with codec ('zstd', 'gzip' or 'none').
+# With adaptive['enabled'], iters is ignored and the number of runs is 
+# chosen as described in DEFAULT_ADAPTIVE.
 # Returns a list of output file names (packet traces in JSON).
-def run_client(client: str, endpoint: str, iters: int) -> list[str]:
+def run_client(client: str, endpoint: str, iters: int, 
+               out_dir: pathlib.Path = PCAP_OUT_DIR, codec: str = 'zstd', 
+               workload: dict | None = None, adaptive: dict | None = None, 
+               online: dict | None = None) -> list[str]:
     print(f'--- START CLIENT: {client} ---\n')
 
     # determine if client is h2 or h3
@@ -109,10 +257,30 @@ def run_client(client: str, endpoint: str, iters: int) -> list[str]:
     print(f'Targeting host: {url_host}, port: {url_port}, path: {url_path}')
 
     # generate client commands
-    cmds: list[str] = client_cmds(client, endpoint, url_host, url_port, url_path)
+    workload = get_workload(workload)
+    if (workload['objects'] > 1) and (client not in SEQUENTIAL_OBJECT_CLIENTS):
+        print(f'Error: {client} cannot request objects sequentially on a stream '
+              f'(objects = {workload["objects"]}), exiting.')
+        return []
+    urls: list[str] = workload_urls(endpoint, workload)
+    cmds: list[str] = client_cmds(client, urls, url_host, url_port, workload['streams'])
     if cmds == []:
         print(f'Error: client field is invalid ({client}), exiting.')
-        return
+        return []
+    print(f'Workload: {len(urls)} request(s) on each of {workload["connections"]} connection(s)')
+
+    name = workload_name(workload)
+    client_out_dir = out_dir.joinpath(f'{client}-{name}' if name else client)
+    make_dirs([client_out_dir])
+    json_suffix = '.json' + SUFFIXES[resolve_codec(codec)]
+
+    adaptive = get_adaptive(adaptive)
+    if adaptive['enabled']:
+        iters = adaptive['max_iters']
+    samples: dict[str, list[float]] = {'completion_ms': [], 'goodput_mbps': []}
+    online = get_online(online)
+    if online['enabled']:
+        from analysis.online import OnlineAckTracker, tshark_fields_cmd, start_capture, follow_capture
 
     outputs = []
     for i in range(iters):
@@ -130,19 +298,60 @@ def run_client(client: str, endpoint: str, iters: int) -> list[str]:
         pcap_file = f'{TMP_PCAP_DIR}/out-{curr_time}.pcap'
         pcap_process = run_pcap(pcap_file, url_host, url_port, url_path, env)
 
-        # hit endpoint
+        # follow the transfer live (see DEFAULT_ONLINE)
+        if online['enabled']:
+            tracker = OnlineAckTracker(is_h3, online['steady_rtts'], 
+                                       on_change=print_phase_change)
+            fields_process = start_capture(tshark_fields_cmd(
+                is_h3, online['interface'], url_host, ssl_key_log_file), env)
+            follower = threading.Thread(target=follow_capture, 
+                                        args=(fields_process, tracker), daemon=True)
+            follower.start()
+
+        # hit endpoint, over parallel connections if requested
         time.sleep(1)
-        subprocess.run(cmds, capture_output=True, env=env)
+        processes = [subprocess.Popen(cmds, stdout=subprocess.DEVNULL, 
+                                      stderr=subprocess.DEVNULL, env=env)
+                     for _ in range(workload['connections'])]
+        aborted = False
+        if online['enabled'] and online['abort_on_steady']:
+            while any(process.poll() is None for process in processes):
+                if tracker.steady:
+                    print(f'Steady state after {tracker.bin} RTTs, aborting run')
+                    for process in processes:
+                        process.terminate()
+                    aborted = True
+                    break
+                time.sleep(0.1)
+        for process in processes:
+            process.wait()
 
         # stop recording pcap
         time.sleep(1)
         pcap_process.kill()
+        if online['enabled']:
+            fields_process.terminate()
+            follower.join()
         
         # read pcap into JSON
         time.sleep(1)
-        json_file = f'{PCAP_OUT_DIR}/out-{curr_time}.json'
+        tag = ABORTED_TAG if aborted else ''
+        json_file = f'{client_out_dir}/out-{curr_time}{tag}{json_suffix}'
         outputs.append(json_file)
         read_pcap(is_h3, pcap_file, json_file, ssl_key_log_file, env)
+
+        # stop once the medians are known precisely enough
+        if adaptive['enabled'] and not aborted:
+            metrics = get_run_metrics(json_file)
+            if metrics is None:
+                print(f'Warning: no metrics from {json_file}, run not counted')
+                continue
+            for metric, value in metrics.items():
+                samples[metric].append(value)
+            if (len(samples['completion_ms']) >= adaptive['min_iters']) and \
+               is_converged(samples, adaptive['target_ci'], adaptive['confidence']):
+                print(f'Converged after {i + 1} run(s)')
+                break
     
     print(f'--- STOP CLIENT: {client} ---\n')
     return outputs
@@ -177,9 +386,33 @@ def run_benchmark(config_file: str) -> dict[str, list[str]]:
     if iters is None:
         iters = 1  # default number of iterations
 
+    # Get compression of traces (zstd, gzip or none)
+    codec: str = d.get('compression')
+    if codec is None:
+        codec = 'zstd'  # default compression
+
+    # Traces are written to pcap/<network config>/<client>/
+    network_configs = d.get('network')
+    out_dir = PCAP_OUT_DIR
+    if network_configs is not None:
+        out_dir = PCAP_OUT_DIR.joinpath(network_config_name(network_configs))
+
+    # Get workload (see DEFAULT_WORKLOAD)
+    workload: dict = get_workload(d.get('workload'))
+    if workload['sizes'] and ('{size}' not in endpoint):
+        print("Error: workload sizes given but endpoint has no {size} field, exiting.")
+        return
+
+    # Get adaptive iteration settings (see DEFAULT_ADAPTIVE)
+    adaptive: dict = get_adaptive(d.get('adaptive'))
+
+    # Get online detection settings (see DEFAULT_ONLINE)
+    online: dict = get_online(d.get('online'))
+
     outputs = {}
     for client in clients:
-        client_out: list[str] = run_client(client, endpoint, iters)
+        client_out: list[str] = run_client(client, endpoint, iters, out_dir, codec, 
+                                           workload, adaptive, online)
         outputs[client] = client_out
     
     print(f'--- END BENCHMARK ---\n')    
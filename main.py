@@ -1,64 +1,378 @@
-import subprocess
-
-import numpy as np
-from network.generate_cmds import generate_cmds
-from clients.run_clients import run_benchmark
-from clients.helper import is_client_tcp
-from analysis.analyze_ack import *
-from analysis.changepoint import Changepoint
-from analysis.eval_changepoint import *
+import sys
+import argparse
 
 CONFIG_FILE = './param.json'
 
-def main():
+# Heavy dependencies (numpy, ruptures) are imported inside each command so
+# that quick commands start fast.
+
+def cmd_capture(args) -> int:
+    import subprocess
+    from network.generate_cmds import generate_cmds
+    from clients.run_clients import run_benchmark
+
     # Run network commands
-    cmds = generate_cmds(CONFIG_FILE)
+    cmds = generate_cmds(args.config)
     subprocess.run(cmds, capture_output=True, shell=True)
 
     # Run benchmarks
-    clients: dict[str, list[str]] = run_benchmark(CONFIG_FILE)
-
-    # Generate plots
-    print("clients:", clients)
+    clients: dict[str, list[str]] = run_benchmark(args.config)
+    if clients is None:
+        return 1
     for client in clients:
         for json_file in clients[client]:
             print(f'{client}: {json_file}')
-            if (is_client_tcp(client)):
-                generate_plot_tcp(json_file, client=client)
-            else:
-                # generate_plot_quic(json_file, client=client)
-                generate_csv_quic(json_file, client=client)
-
-def test_changepoint_algorithm():
-    csv_file = "./csv/meta-5MB-delay0-loss0.json"
-    correct_bkps = np.array([10, 61, 83, 107, 113, 143, 167, 231, 267, 310, 342])
-    raw = read_csv_quic(csv_file)
-    if raw is None:
-        return
-    
-    rtts = raw['rtts']
-    cum_acks = raw['cum_acks']
-
-    err      = None
-    min_size = None
-    jump     = None
-    sigma    = None
-    width    = None
-
-    # (err, min_size, jump) = best_params_pelt(rtts, cum_acks, correct_bkps)
-    # (err, sigma) = best_params_binseg(rtts, cum_acks, correct_bkps)
-    # (err, sigma) = best_params_bottomup(rtts, cum_acks, correct_bkps)
-    # (err, sigma, width) = best_params_window(rtts, cum_acks, correct_bkps)
-    
-    print(f'err: {err}')
-    print(f'min_size: {min_size}, jump: {jump}')
-    print(f'sigma: {sigma}')
-    print(f'width: {width}')
-
-    generate_plot_quic_csv("./csv/meta-5MB-delay0-loss0.json", correct_bkps, 
-                           alg = Changepoint.CUSUM, min_size=min_size, jump=jump,
-                           sigma=sigma, width=width)
-
-# main()
-test_changepoint_algorithm()
-# generate_plot_quic_csv("./csv/meta-5MB-delay0-loss0.json")
+    return 0
+
+def get_authkey(args) -> bytes | None:
+    import os
+    from clients.distributed import AUTHKEY_ENV
+
+    authkey = args.authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        print(f'[ERROR] no shared secret: pass --authkey or set {AUTHKEY_ENV}')
+        return None
+    return authkey.encode()
+
+def cmd_coordinate(args) -> int:
+    from clients.distributed import run_distributed, parse_address
+
+    authkey = get_authkey(args)
+    if authkey is None:
+        return 1
+    coordinator = run_distributed(args.config, args.out_dir, authkey, parse_address(args.listen),
+                                  args.local_workers, args.dry_run, args.fail_prob,
+                                  args.max_attempts, args.task_timeout)
+    return 1 if coordinator.failed else 0
+
+def cmd_work(args) -> int:
+    from clients.distributed import run_worker, parse_address
+
+    authkey = get_authkey(args)
+    if authkey is None:
+        return 1
+    run_worker(parse_address(args.connect), authkey, args.dry_run)
+    return 0
+
+def cmd_analyze(args) -> int:
+    from analysis.batch import analyze_dir, write_results
+    from analysis.rtt import RTTNormType
+    from analysis.decimate import DecimateType
+
+    rows = analyze_dir(args.dir, norm=RTTNormType[args.norm.upper()],
+                       cache_dir=args.cache_dir, codec=args.codec,
+                       decimation=DecimateType[args.decimate.upper()],
+                       max_workers=args.workers)
+    write_results(rows, args.out)
+    print(f'{len(rows)} connection(s) from {len({r["path"] for r in rows})} '
+          f'trace(s) written to {args.out}')
+    return 0
+
+def cmd_tune(args) -> int:
+    from analysis.trace import load_trace
+    from analysis.changepoint import CDAType
+    from analysis.eval_changepoint import grid_search_p, grid_search_p_width
+
+    trace = load_trace(args.trace)
+    if trace is None:
+        return 1
+
+    cda_type = CDAType[args.alg.upper()]
+    true_bkps = list(args.bkps)
+    if (len(true_bkps) == 0) or (true_bkps[-1] != len(trace)):
+        true_bkps.append(len(trace))  # ruptures expects the end as last breakpoint
+
+    if cda_type == CDAType.WINDOW:
+        (p, width, f1_score) = grid_search_p_width(trace.rtts, trace.cum_acks, true_bkps, cda_type)
+        print(f'p: {p}, width: {width}, f1: {f1_score}')
+    else:
+        (p, f1_score) = grid_search_p(trace.rtts, trace.cum_acks, true_bkps, cda_type)
+        print(f'p: {p}, f1: {f1_score}')
+    return 0
+
+def cmd_diverge(args) -> int:
+    from analysis.divergence import check_divergence
+
+    ret = check_divergence(args.pcap_file1, args.pcap_file2)
+    print(ret.msg)
+    if ret.div_start_idx is not None:
+        print(f'divergence starts at segment {ret.div_start_idx}')
+    return 1 if ret.is_different else 0
+
+def cmd_streams(args) -> int:
+    from analysis.analyze import pcap_file_to_json, detect_protocol
+    from analysis.streams import all_stream_traces, summarize_streams
+    from analysis.rtt import RTTNormType
+
+    d = pcap_file_to_json(args.trace)
+    if not d:
+        print(f'[ERROR] no packets in {args.trace}')
+        return 1
+    traces = all_stream_traces(d, detect_protocol(d), RTTNormType[args.norm.upper()])
+    print('\t'.join(['connection', 'stream', 'bytes_acked', 'first_ack_ms', 'completion_ms']))
+    for row in summarize_streams(traces):
+        print('\t'.join([str(row.connection), str(row.stream), str(row.bytes_acked),
+                         f'{row.first_ack_ms:.1f}', f'{row.completion_ms:.1f}']))
+    return 0
+
+def cmd_watch(args) -> int:
+    from analysis.online import OnlineAckTracker, tshark_fields_cmd, start_capture, follow_capture
+    from clients.run_clients import print_phase_change
+
+    tracker = OnlineAckTracker(args.h3, args.steady_rtts, on_change=print_phase_change)
+    should_stop = (lambda: tracker.steady) if args.stop_on_steady else None
+    try:
+        if args.iface is None:  # tshark -T fields output piped to stdin
+            tracker.feed(sys.stdin, should_stop)
+        else:
+            cmd = tshark_fields_cmd(args.h3, args.iface, args.host, args.keylog)
+            returncode = follow_capture(start_capture(cmd), tracker, should_stop)
+            if returncode != 0:
+                print(f'[ERROR] tshark exited with code {returncode}')
+                return returncode
+    except KeyboardInterrupt:
+        pass
+    print(f'{tracker.bytes_acked} bytes ACKed, {len(tracker.changes)} phase change(s), '
+          f'{"steady" if tracker.steady else "not steady"}')
+    return 0
+
+def cmd_metrics(args) -> int:
+    from analysis.batch import read_results
+    from analysis.metrics import fill_metrics, write_metrics_csv, write_throughput_csv
+
+    rows = fill_metrics(read_results(args.results), args.window_ms)
+    write_metrics_csv(rows, args.out)
+    print(f'metrics of {len(rows)} connection(s) written to {args.out}')
+    if args.series is not None:
+        n = write_throughput_csv(rows, args.series, args.window_ms, args.step_ms)
+        print(f'throughput series of {n} trace(s) written to {args.series}')
+    return 0
+
+def cmd_report(args) -> int:
+    from analysis.batch import read_results, summarize_results
+
+    summary = summarize_results(read_results(args.results))
+    cols = ['network', 'client', 'traces', 'connections', 'aborted', 'bytes_acked',
+            'median_duration', 'median_bkps']
+    print('\t'.join(cols))
+    for row in summary:
+        print('\t'.join(str(row[col]) for col in cols))
+    return 0
+
+def cmd_aggregate(args) -> int:
+    import json
+    import numpy as np
+    from analysis.batch import read_results
+    from analysis.aggregate import aggregate_results, aggregate_to_dict
+
+    aggs = aggregate_results(read_results(args.results), grid_points=args.grid_points)
+    with open(args.out, 'w') as f:
+        json.dump({f'{network}/{client}': aggregate_to_dict(agg)
+                   for (network, client), agg in aggs.items()}, f)
+
+    print('\t'.join(['network', 'client', 'iterations', 'completion_rtts_p25',
+                     'completion_rtts_p50', 'completion_rtts_p75', 'median_phase_rates']))
+    for (network, client), agg in aggs.items():
+        q25, q50, q75 = np.percentile(agg.completion_rtts, [25, 50, 75])
+        phase_rates = np.nanmedian(agg.phase_rates, axis=0) if agg.phase_rates.size else []
+        print('\t'.join([network, client, str(agg.curves.shape[0]),
+                         f'{q25:.2f}', f'{q50:.2f}', f'{q75:.2f}',
+                         ' '.join(f'{r:.0f}' for r in phase_rates)]))
+    return 0
+
+def cmd_plot(args) -> int:
+    from analysis.batch import read_results
+    from analysis.plot import plot_results
+
+    index = plot_results(read_results(args.results), args.out_dir, fmt=args.format,
+                         max_workers=args.workers)
+    print(f'figures written to {args.out_dir}, index at {index}')
+    return 0
+
+def cmd_baseline(args) -> int:
+    from analysis.batch import read_results
+    from analysis.baseline import save_baseline
+
+    baseline = save_baseline(read_results(args.results), args.out)
+    print(f'baseline of {len(baseline["groups"])} group(s) written to {args.out}')
+    return 0
+
+def cmd_gate(args) -> int:
+    import json
+    from analysis.batch import read_results
+    from analysis.baseline import load_baseline, gate
+
+    report = gate(read_results(args.results), load_baseline(args.baseline),
+                  alpha=args.alpha, min_effect=args.min_effect,
+                  max_slowdown=args.max_slowdown, max_rate_drop=args.max_rate_drop)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    for key, group in report['groups'].items():
+        print(f'{key}: {group["status"]}')
+    print(f'gate: {"PASS" if report["pass"] else "FAIL"} (report written to {args.out})')
+    return 0 if report['pass'] else 1
+
+def cmd_archive(args) -> int:
+    import pathlib
+    from analysis.batch import find_traces
+    from utils.compress import get_codec, resolve_codec, recompress_file
+
+    # Packet traces only: results, baselines and manifests are read as plain JSON
+    codec = resolve_codec(args.codec)
+    paths = [pathlib.Path(p) for p in find_traces(args.dir) if get_codec(p) != codec]
+    failed = 0
+    for i, path in enumerate(paths, start=1):
+        try:
+            before = path.stat().st_size
+            out = recompress_file(str(path), codec)
+            after = pathlib.Path(out).stat().st_size
+            print(f'[{i}/{len(paths)}] {path}: {before} -> {after} bytes')
+        except (OSError, RuntimeError) as e:
+            print(f'[ERROR] {path}: {e}')
+            failed += 1
+    return 1 if failed else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Automated QUIC benchmark and analysis tools.')
+    parser.add_argument('--cp-cache', default=None, metavar='DIR',
+                        help='keep changepoint and polynomial fits on disk here')
+    parser.add_argument('--cp-cache-mb', type=int, default=256,
+                        help='size bound of the on-disk cache [MB]')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('capture', help='shape the network and run all clients')
+    p.add_argument('--config', default=CONFIG_FILE, help='benchmark config (JSON)')
+    p.set_defaults(func=cmd_capture)
+
+    p = subparsers.add_parser('coordinate', help='distribute a sweep over worker hosts')
+    p.add_argument('--config', default=CONFIG_FILE, help='benchmark config (JSON)')
+    p.add_argument('--listen', default='127.0.0.1:6000',
+                   help='address workers connect to (e.g. 0.0.0.0:6000 for remote workers)')
+    p.add_argument('--authkey', default=None,
+                   help='shared secret of workers (default: $QUIC_AUTOMATED_AUTHKEY)')
+    p.add_argument('--out-dir', default='sweep', help='results, manifest and traces')
+    p.add_argument('--local-workers', type=int, default=0,
+                   help='also run this many workers on this host')
+    p.add_argument('--dry-run', action='store_true',
+                   help='local workers simulate captures (no shaping, no clients)')
+    p.add_argument('--fail-prob', type=float, default=0.0,
+                   help='local workers fail tasks with this probability (to test retries)')
+    p.add_argument('--max-attempts', type=int, default=3, help='runs of a task before giving up')
+    p.add_argument('--task-timeout', type=float, default=600.0,
+                   help='seconds before a running task is handed out again')
+    p.set_defaults(func=cmd_coordinate)
+
+    p = subparsers.add_parser('work', help='run tasks of a coordinator on this host')
+    p.add_argument('--connect', required=True, help='coordinator address (host:port)')
+    p.add_argument('--authkey', default=None,
+                   help='shared secret of the coordinator (default: $QUIC_AUTOMATED_AUTHKEY)')
+    p.add_argument('--dry-run', action='store_true', help='simulate captures')
+    p.set_defaults(func=cmd_work)
+
+    p = subparsers.add_parser('analyze', help='analyze every trace under a directory')
+    p.add_argument('dir', help='directory of JSON packet traces')
+    p.add_argument('--out', default='results.json', help='summary output (JSON)')
+    p.add_argument('--cache-dir', default=None, help='save per-connection traces here')
+    p.add_argument('--norm', default='static', choices=['static', 'min_rtt', 'smoothed'],
+                   help='RTT used to normalize times')
+    p.add_argument('--codec', default='zstd', choices=['zstd', 'gzip', 'none'],
+                   help='compression of cached traces')
+    p.add_argument('--decimate', default='none', choices=['none', 'rtt_bins', 'lttb', 'coalesce'],
+                   help='reduce long series before changepoint detection')
+    p.add_argument('--workers', type=int, default=None, help='process pool size')
+    p.set_defaults(func=cmd_analyze)
+
+    p = subparsers.add_parser('streams', help='per-stream bytes ACKed and completion times')
+    p.add_argument('trace', help='JSON packet trace')
+    p.add_argument('--norm', default='static', choices=['static', 'min_rtt', 'smoothed'],
+                   help='RTT used to normalize times')
+    p.set_defaults(func=cmd_streams)
+
+    p = subparsers.add_parser('watch', help='detect phase changes on a live capture')
+    p.add_argument('--iface', default=None,
+                   help='capture on this interface (default: read tshark fields from stdin)')
+    p.add_argument('--host', default=None,
+                   help='capture filter host (default: all traffic on --iface)')
+    p.add_argument('--h3', action='store_true', help='QUIC traffic (default: TCP)')
+    p.add_argument('--keylog', default=None, help='TLS key log, needed for QUIC')
+    p.add_argument('--steady-rtts', type=int, default=20,
+                   help='RTTs without change after which the phase is steady')
+    p.add_argument('--stop-on-steady', action='store_true')
+    p.set_defaults(func=cmd_watch)
+
+    p = subparsers.add_parser('tune', help='grid-search changepoint parameters on a trace')
+    p.add_argument('trace', help='trace in the cache format')
+    p.add_argument('--alg', default='pelt', choices=['pelt', 'binseg', 'bottomup', 'window'])
+    p.add_argument('--bkps', type=int, nargs='+', required=True, help='true breakpoints')
+    p.set_defaults(func=cmd_tune)
+
+    p = subparsers.add_parser('diverge', help='check whether two QUIC traces diverge')
+    p.add_argument('pcap_file1')
+    p.add_argument('pcap_file2')
+    p.set_defaults(func=cmd_diverge)
+
+    p = subparsers.add_parser('aggregate', help='median curves and bands per (network, client)')
+    p.add_argument('results', nargs='?', default='results.json',
+                   help='output of analyze (run with --cache-dir)')
+    p.add_argument('--out', default='aggregate.json', help='aggregate output (JSON)')
+    p.add_argument('--grid-points', type=int, default=500, help='resolution of the RTT grid')
+    p.set_defaults(func=cmd_aggregate)
+
+    p = subparsers.add_parser('plot', help='render every trace, overlays and an index page')
+    p.add_argument('results', nargs='?', default='results.json',
+                   help='output of analyze (run with --cache-dir)')
+    p.add_argument('--out-dir', default='plots', help='figure output directory')
+    p.add_argument('--format', default='png', choices=['png', 'pdf'])
+    p.add_argument('--workers', type=int, default=None, help='process pool size')
+    p.set_defaults(func=cmd_plot)
+
+    p = subparsers.add_parser('baseline', help='store reference statistics of a run')
+    p.add_argument('results', nargs='?', default='results.json',
+                   help='output of analyze (run with --cache-dir)')
+    p.add_argument('--out', default='baseline.json', help='baseline output (JSON)')
+    p.set_defaults(func=cmd_baseline)
+
+    p = subparsers.add_parser('gate', help='test a run against a baseline')
+    p.add_argument('results', nargs='?', default='results.json',
+                   help='output of analyze (run with --cache-dir)')
+    p.add_argument('--baseline', default='baseline.json')
+    p.add_argument('--out', default='gate.json', help='report output (JSON)')
+    p.add_argument('--alpha', type=float, default=0.05, help='significance level')
+    p.add_argument('--min-effect', type=float, default=0.3,
+                   help='minimum |rank-biserial correlation| to flag a change')
+    p.add_argument('--max-slowdown', type=float, default=0.05,
+                   help='tolerated increase of median completion time')
+    p.add_argument('--max-rate-drop', type=float, default=0.10,
+                   help='tolerated decrease of median per-phase rate')
+    p.set_defaults(func=cmd_gate)
+
+    p = subparsers.add_parser('archive', help='recompress old traces in place')
+    p.add_argument('dir', help='directory of JSON traces')
+    p.add_argument('--codec', default='zstd', choices=['zstd', 'gzip'])
+    p.set_defaults(func=cmd_archive)
+
+    p = subparsers.add_parser('metrics', help='export per-connection metrics as CSV')
+    p.add_argument('results', nargs='?', default='results.json', help='output of analyze')
+    p.add_argument('--out', default='metrics.csv', help='metrics table (CSV)')
+    p.add_argument('--series', default=None,
+                   help='also write throughput series here (CSV, needs analyze --cache-dir)')
+    p.add_argument('--window-ms', type=float, default=100.0, help='throughput window [ms]')
+    p.add_argument('--step-ms', type=float, default=10.0, help='throughput series step [ms]')
+    p.set_defaults(func=cmd_metrics)
+
+    p = subparsers.add_parser('report', help='summarize the output of analyze')
+    p.add_argument('results', nargs='?', default='results.json')
+    p.set_defaults(func=cmd_report)
+
+    return parser
+
+def main(argv: list[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.cp_cache is not None:
+        from analysis.cache import set_cache
+        set_cache(disk_dir=args.cp_cache, max_disk_bytes=args.cp_cache_mb << 20)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
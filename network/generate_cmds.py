@@ -15,6 +15,33 @@ def write_cmds(f, cmds: list[str]):
         f.write(f'{cmd}\n')
     f.write('\n')
 
+def network_config_name(network_configs: dict[str, int]) -> str:
+    """
+    Returns the name identifying a set of network parameters, e.g. 
+    'loss-0.1-delay-50-bw-100-jitter-30-burstingress-75-burstegress-50'. 
+    Used for the generated .sh file and for per-config output directories. 
+
+    Args:
+        network_configs (dict): network parameters (the 'network' field of 
+                                the config file).
+
+    Returns:
+        str: name of the network configuration.
+    """
+    loss          = network_configs.get('loss')
+    delay         = network_configs.get('delay')
+    bw            = network_configs.get('bw')
+    jitter        = network_configs.get('jitter')
+    burst_ingress = network_configs.get('burst_ingress')
+    burst_egress  = network_configs.get('burst_egress')
+
+    jitter_file = f'-jitter-{jitter}' if (jitter != 0) else ''
+    burst_ingress_file = f'-burstingress-{burst_ingress}' if (burst_ingress != 0) else ''
+    burst_egress_file = f'-burstegress-{burst_egress}' if (burst_egress != 0) else ''
+
+    return (f'loss-{loss}-delay-{delay}-bw-{bw}'
+            f'{jitter_file}{burst_ingress_file}{burst_egress_file}')
+
 def generate_cmds(config_file: str) -> list[str]:
     """
     Generates shell commands for network parameters provided in @config_file. 
@@ -61,12 +88,7 @@ def generate_cmds(config_file: str) -> list[str]:
     bw_burst_str = '{:.1f}KB'.format(bw_burst)
 
     # Generate .sh file with Linux network commands
-    jitter_file = f'-jitter-{jitter}' if include_jitter else ''
-    burst_ingress_file = f'-burstingress-{burst_ingress}' if include_burst_ingress else ''
-    burst_egress_file = f'-burstegress-{burst_egress}' if include_burst_egress else ''
-
-    sh_file_name = (f'loss-{loss}-delay-{delay}-bw-{bw}'
-                    f'{jitter_file}{burst_ingress_file}{burst_egress_file}.sh')
+    sh_file_name = f'{network_config_name(network_configs)}.sh'
     sh_dir = './network'
     sh_fd = open(f'{sh_dir}/{sh_file_name}', 'w')
 
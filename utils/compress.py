@@ -0,0 +1,100 @@
+import io
+import os
+import gzip
+import shutil
+import hashlib
+from utils.logging import Logging, log
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, fall back to gzip
+    zstandard = None
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# {codec : file suffix}
+SUFFIXES = {
+    'zstd': '.zst',
+    'gzip': '.gz',
+    'none': '',
+}
+
+_warned_zstd = False  # missing zstandard is reported once per process
+
+def get_codec(path: str) -> str:
+    """ Returns the codec of @path, from its suffix. """
+    for codec, suffix in SUFFIXES.items():
+        if suffix and str(path).endswith(suffix):
+            return codec
+    return 'none'
+
+def resolve_codec(codec: str) -> str:
+    """ Returns @codec, or gzip if @codec is zstd and zstandard is missing. """
+    global _warned_zstd
+    if (codec == 'zstd') and (zstandard is None):
+        if not _warned_zstd:
+            log(Logging.WARN, 'zstandard is not installed, using gzip instead')
+            _warned_zstd = True
+        return 'gzip'
+    return codec
+
+def strip_codec_suffix(path: str) -> str:
+    """ Returns @path without its compression suffix, if any. """
+    suffix = SUFFIXES[get_codec(path)]
+    return str(path)[:-len(suffix)] if suffix else str(path)
+
+def open_stream(path: str, mode: str = 'rb'):
+    """
+    Opens @path as a binary stream, compressing on write and decompressing on
+    read according to its suffix (.zst, .gz, or none). Data is processed
+    incrementally; the whole file is never held in memory.
+    """
+    assert(mode in ('rb', 'wb'))
+    match get_codec(path):
+        case 'zstd':
+            if zstandard is None:
+                raise RuntimeError(f'zstandard is required to open {path}')
+            if mode == 'rb':
+                return zstandard.open(path, mode, dctx=zstandard.ZstdDecompressor())
+            return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+        case 'gzip':
+            return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+        case _:
+            return open(path, mode)
+
+def open_text(path: str, mode: str = 'r'):
+    """ Same as open_stream, as a UTF-8 text stream. """
+    assert(mode in ('r', 'w'))
+    return io.TextIOWrapper(open_stream(path, mode + 'b'), encoding='utf-8')
+
+def stream_digest(path: str) -> str:
+    """ SHA-256 of the decompressed contents of @path. """
+    h = hashlib.sha256()
+    with open_stream(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+def recompress_file(src: str, codec: str, remove: bool = True) -> str:
+    """
+    Rewrites @src with @codec, verifying the decompressed contents before
+    removing @src (if @remove).
+
+    Returns:
+        str: path of the recompressed file (@src if already using @codec).
+    """
+    if get_codec(src) == codec:
+        return src
+    dst = strip_codec_suffix(src) + SUFFIXES[codec]
+
+    with open_stream(src, 'rb') as fin, open_stream(dst, 'wb') as fout:
+        shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+
+    if stream_digest(src) != stream_digest(dst):
+        os.remove(dst)
+        raise RuntimeError(f'verification failed while recompressing {src}')
+    if remove:
+        os.remove(src)
+    return dst